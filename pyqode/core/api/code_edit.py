@@ -593,7 +593,7 @@ class CodeEdit(QtWidgets.QPlainTextEdit):
         Closes the editor, stops the backend and removes any installed
         mode/panel.
 
-        This is also where we cache the cursor position.
+        This is also where we cache the cursor position and the fold state.
 
         :param clear: True to clear the editor content before closing.
         """
@@ -603,6 +603,8 @@ class CodeEdit(QtWidgets.QPlainTextEdit):
         if self._tooltips_runner:
             self._tooltips_runner.cancel_requests()
             self._tooltips_runner = None
+        # cache the fold state while the folding panel is still installed
+        self.file._cache_fold_state()
         self.decorations.clear()
         self.modes.clear()
         self.panels.clear()
@@ -652,7 +654,15 @@ class CodeEdit(QtWidgets.QPlainTextEdit):
         self._modified_lines.clear()
         import time
         t = time.time()
+        highlighter = self.syntax_highlighter
+        chunked = (highlighter is not None and txt.count('\n') >=
+                   highlighter.CHUNKED_REHIGHLIGHT_THRESHOLD)
+        if chunked:
+            # don't let QSyntaxHighlighter highlight the whole text at once
+            highlighter.defer_highlighting()
         super(CodeEdit, self).setPlainText(txt)
+        if chunked:
+            highlighter.rehighlight()
         _logger().log(5, 'setPlainText duration: %fs' % (time.time() - t))
         self.new_text_set.emit()
         self.redoAvailable.emit(False)
@@ -1084,10 +1094,9 @@ class CodeEdit(QtWidgets.QPlainTextEdit):
         self.mouse_pressed.emit(event)
         if event.button() == QtCore.Qt.LeftButton:
             cursor = self.cursorForPosition(event.pos())
-            for sel in self.decorations:
+            for sel in self.decorations.at_cursor(cursor):
                 if sel.cursor.blockNumber() == cursor.blockNumber():
-                    if sel.contains_cursor(cursor):
-                        sel.signals.clicked.emit(sel)
+                    sel.signals.clicked.emit(sel)
         if not event.isAccepted():
             event.setAccepted(initial_state)
             super(CodeEdit, self).mousePressEvent(event)
@@ -1128,8 +1137,8 @@ class CodeEdit(QtWidgets.QPlainTextEdit):
         cursor = self.cursorForPosition(event.pos())
         self._last_mouse_pos = event.pos()
         block_found = False
-        for sel in self.decorations:
-            if sel.contains_cursor(cursor) and sel.tooltip:
+        for sel in self.decorations.at_cursor(cursor):
+            if sel.tooltip:
                 if (self._prev_tooltip_block_nbr != cursor.blockNumber() or
                         not QtWidgets.QToolTip.isVisible()):
                     pos = event.pos()
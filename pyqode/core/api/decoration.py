@@ -14,7 +14,8 @@ class TextDecoration(QtWidgets.QTextEdit.ExtraSelection):
     (useful for errors markers and so on...)
 
     Text decoration expose a **clicked** signal stored in a separate QObject:
-        :attr:`pyqode.core.api.TextDecoration.Signals`
+        :attr:`pyqode.core.api.TextDecoration.Signals`. The QObject is only
+        created the first time :attr:`signals` is accessed.
 
     .. code-block:: python
 
@@ -32,6 +33,8 @@ class TextDecoration(QtWidgets.QTextEdit.ExtraSelection):
         #: Signal emitted when a TextDecoration has been clicked.
         clicked = QtCore.Signal(object)
 
+    __slots__ = ('_signals', 'draw_order', 'tooltip')
+
     def __init__(self, cursor_or_bloc_or_doc, start_pos=None, end_pos=None,
                  start_line=None, end_line=None, draw_order=0, tooltip=None,
                  full_width=False):
@@ -58,7 +61,7 @@ class TextDecoration(QtWidgets.QTextEdit.ExtraSelection):
         .. note:: Use the cursor selection if startPos and endPos are none.
         """
         super(TextDecoration, self).__init__()
-        self.signals = self.Signals()
+        self._signals = None
         self.draw_order = draw_order
         self.tooltip = tooltip
         self.cursor = QtGui.QTextCursor(cursor_or_bloc_or_doc)
@@ -69,12 +72,31 @@ class TextDecoration(QtWidgets.QTextEdit.ExtraSelection):
         if end_pos is not None:
             self.cursor.setPosition(end_pos, QtGui.QTextCursor.KeepAnchor)
         if start_line is not None:
-            self.cursor.movePosition(self.cursor.Start, self.cursor.MoveAnchor)
-            self.cursor.movePosition(self.cursor.Down, self.cursor.MoveAnchor,
-                                     start_line)
+            self.cursor.setPosition(self._line_position(start_line))
         if end_line is not None:
-            self.cursor.movePosition(self.cursor.Down, self.cursor.KeepAnchor,
-                                     end_line - start_line)
+            self.cursor.setPosition(self._line_position(end_line),
+                                    QtGui.QTextCursor.KeepAnchor)
+
+    @property
+    def signals(self):
+        """
+        Returns the decoration signals (:class:`Signals`), the QObject is
+        created on first access.
+        """
+        if self._signals is None:
+            self._signals = self.Signals()
+        return self._signals
+
+    def _line_position(self, line):
+        """
+        Returns the position of the start of a line (0 based), or the start
+        of the last line if the document has less lines.
+        """
+        document = self.cursor.document()
+        block = document.findBlockByNumber(line)
+        if not block.isValid():
+            block = document.lastBlock()
+        return block.position()
 
     def contains_cursor(self, cursor):
         """
@@ -3,9 +3,11 @@ This module contains the code folding API.
 
 """
 from __future__ import print_function
+import bisect
 import logging
 import sys
 from pyqode.core.api.utils import TextBlockHelper
+from pyqode.qt import QtCore
 
 
 def print_tree(editor, file=sys.stdout, print_blocks=False):
@@ -38,6 +40,183 @@ def _logger():
     return logging.getLogger(__name__)
 
 
+def _block_entry(block, text):
+    """
+    Packs the fold info of a block: fold level, fold trigger flag and blank
+    line flag.
+    """
+    state = block.userState()
+    if state == -1:
+        state = 0
+    return (((state & 0x03FF0000) >> 14) | ((state & 0x04000000) >> 25) |
+            (text.strip() == ''))
+
+
+class _FoldIndex(QtCore.QObject):
+    """
+    Index of the fold scopes of a document, used by :class:`FoldScope` to
+    find scope ranges and parents without walking the blocks.
+
+    The index is a child of the document (there is one index per document,
+    shared between cloned editors). It keeps the packed fold info of each
+    block, updated by :meth:`FoldDetector.process_block`, and lazily rebuilds
+    the scope tree (end line and parent of each fold trigger) when the fold
+    structure changed.
+    """
+    @classmethod
+    def get(cls, document):
+        """
+        Gets the fold index of a document, creates it if needed.
+        """
+        index = document.findChild(cls)
+        if index is None:
+            index = cls(document)
+        return index
+
+    def __init__(self, document):
+        super(_FoldIndex, self).__init__(document)
+        self.document = document
+        # packed fold info by block number, None if not known yet
+        self._entries = [None] * document.blockCount()
+        self._complete = False
+        # sorted trigger block numbers, and (level, end, end without the
+        # trailing blank lines, parent trigger) by trigger block number.
+        # None when the fold structure changed.
+        self._triggers = None
+        self._scopes = None
+
+    def update(self, block, text):
+        """
+        Updates the fold info of a block that has just been processed by a
+        fold detector, and of the previous blocks it might have updated.
+        """
+        entries = self._entries
+        nbr = block.blockNumber()
+        delta = self.document.blockCount() - len(entries)
+        if delta:
+            # lines have been added/removed after the first block highlighted
+            # after the change.
+            pos = min(nbr + 1, len(entries))
+            if delta > 0:
+                entries[pos:pos] = [None] * delta
+                self._complete = False
+            else:
+                del entries[pos:pos - delta]
+            self._scopes = None
+        entry = _block_entry(block, text)
+        if entries[nbr] != entry:
+            entries[nbr] = entry
+            self._scopes = None
+        # the previous block might have been updated too, and all the
+        # previous blank blocks if the block is not blank.
+        walk = not entry & 1
+        block = block.previous()
+        while block.isValid():
+            nbr = block.blockNumber()
+            entry = _block_entry(block, block.text())
+            if entries[nbr] != entry:
+                entries[nbr] = entry
+                self._scopes = None
+            if not walk or not entry & 1:
+                break
+            block = block.previous()
+
+    def entries(self):
+        """
+        Returns the packed fold info of each block: ``level << 2 |
+        trigger << 1 | blank``.
+        """
+        entries = self._entries
+        if len(entries) != self.document.blockCount():
+            # the document changed without being processed by the detector
+            entries[:] = [None] * self.document.blockCount()
+            self._complete = False
+            self._scopes = None
+        if not self._complete:
+            block = self.document.firstBlock()
+            while block.isValid():
+                nbr = block.blockNumber()
+                if entries[nbr] is None:
+                    entries[nbr] = _block_entry(block, block.text())
+                block = block.next()
+            self._complete = True
+        return entries
+
+    def scopes(self):
+        """
+        Returns the sorted list of trigger block numbers and the dict of
+        scopes (level, end, end without trailing blank lines, parent trigger)
+        indexed by trigger block number.
+        """
+        entries = self.entries()
+        if self._scopes is None:
+            self._build(entries)
+        return self._triggers, self._scopes
+
+    def _build(self, entries):
+        triggers = []
+        scopes = {}
+        # open scopes: (ref level, trigger), ref levels are increasing
+        opened = []
+        # previous triggers with strictly increasing fold levels
+        parents = []
+        last_non_blank = 0
+        nb_blocks = len(entries)
+        for i, entry in enumerate(entries):
+            lvl = entry >> 2
+            while opened and opened[-1][0] >= lvl:
+                trigger = opened.pop()[1]
+                if i - 1 > trigger:
+                    end, trimmed = i - 1, last_non_blank
+                else:
+                    end = i
+                    trimmed = last_non_blank if entry & 1 else i
+                scopes[trigger][1:3] = end, trimmed
+            if entry & 2:
+                next_lvl = entries[i + 1] >> 2 if i + 1 < nb_blocks else 0
+                while parents and parents[-1][0] >= lvl:
+                    parents.pop()
+                parent = parents[-1][1] if parents else -1
+                parents.append((lvl, i))
+                triggers.append(i)
+                scopes[i] = [lvl, -1, -1, parent]
+                opened.append((lvl if next_lvl != lvl else lvl - 1, i))
+            if not entry & 1:
+                last_non_blank = i
+        for _, trigger in opened:
+            if nb_blocks - 1 > trigger:
+                scopes[trigger][1:3] = nb_blocks - 1, last_non_blank
+        self._triggers = triggers
+        self._scopes = scopes
+
+
+def _apply_fold_states(document, visible, collapsed):
+    """
+    Applies the visibility of the blocks in a single pass over the document
+    (only the blocks whose visibility changed are updated) and the collapsed
+    state of the fold triggers.
+
+    :param document: QTextDocument
+    :param visible: list of block visibility, indexed by block number.
+    :param collapsed: dict of collapsed states, indexed by trigger block
+        number.
+    :return: the first and last blocks whose visibility changed (None if
+        no block changed).
+    """
+    for nbr, state in collapsed.items():
+        TextBlockHelper.set_collapsed(document.findBlockByNumber(nbr), state)
+    first = last = None
+    block = document.firstBlock()
+    for vis in visible:
+        if block.isVisible() != vis:
+            block.setVisible(vis)
+            if first is None:
+                first = block
+            last = block
+        block = block.next()
+    return first, last
+
+
 class FoldDetector(object):
     """
     Base class for fold detectors.
@@ -59,6 +238,8 @@ class FoldDetector(object):
         #: Reference to the parent editor, automatically set by the syntax
         #: highlighter before process any block.
         self._editor = None
+        # fold index of the last processed document
+        self._index = None
         #: Fold level limit, any level greater or equal is skipped.
         #: Default is sys.maxsize (i.e. all levels are accepted)
         self.limit = sys.maxsize
@@ -117,6 +298,11 @@ class FoldDetector(object):
             TextBlockHelper.set_fold_trigger(prev, False)
             TextBlockHelper.set_collapsed(prev, False)
 
+        document = current_block.document()
+        if self._index is None or self._index.document is not document:
+            self._index = _FoldIndex.get(document)
+        self._index.update(current_block, text)
+
     def detect_fold_level(self, prev_block, block):
         """
         Detects the block fold level.
@@ -185,6 +371,10 @@ class FoldScope(object):
     get range, child and parent scopes and so on).
 
     A scope is built from a fold trigger (QTextBlock).
+
+    Ranges and parent scopes are looked up in the fold index of the document
+    (maintained by the fold detector), the blocks are only walked when the
+    index is not up to date (e.g. the highlighter is disabled).
     """
 
     @property
@@ -226,6 +416,18 @@ class FoldScope(object):
             raise ValueError('Not a fold trigger')
         self._trigger = block
 
+    def _indexed_scope(self):
+        """
+        Returns the (level, end, end without blank lines, parent) tuple of
+        the scope in the document fold index, or None if the index does not
+        match the trigger.
+        """
+        _, scopes = _FoldIndex.get(self._trigger.document()).scopes()
+        scope = scopes.get(self._trigger.blockNumber())
+        if scope is not None and scope[0] == self.trigger_level:
+            return scope
+        return None
+
     def get_range(self, ignore_blank_lines=True):
         """
         Gets the fold region range (start and end line).
@@ -237,6 +439,10 @@ class FoldScope(object):
             that is part of the fold scope).
         :returns: tuple(int, int)
         """
+        scope = self._indexed_scope()
+        if scope is not None:
+            return (self._trigger.blockNumber(),
+                    scope[2] if ignore_blank_lines else scope[1])
         ref_lvl = self.trigger_level
         first_line = self._trigger.blockNumber()
         block = self._trigger.next()
@@ -298,8 +504,16 @@ class FoldScope(object):
         This generator generates the list of direct child regions.
         """
         start, end = self.get_range()
-        block = self._trigger.next()
         ref_lvl = self.scope_level
+        if self._indexed_scope() is not None:
+            document = self._trigger.document()
+            triggers, scopes = _FoldIndex.get(document).scopes()
+            for nbr in triggers[bisect.bisect_right(triggers, start):
+                                bisect.bisect_right(triggers, end)]:
+                if scopes[nbr][0] == ref_lvl:
+                    yield FoldScope(document.findBlockByNumber(nbr))
+            return
+        block = self._trigger.next()
         while block.blockNumber() <= end and block.isValid():
             lvl = TextBlockHelper.get_fold_lvl(block)
             trigger = TextBlockHelper.is_fold_trigger(block)
@@ -315,12 +529,17 @@ class FoldScope(object):
         """
         if TextBlockHelper.get_fold_lvl(self._trigger) > 0 and \
                 self._trigger.blockNumber():
-            block = self._trigger.previous()
-            ref_lvl = self.trigger_level - 1
-            while (block.blockNumber() and
-                    (not TextBlockHelper.is_fold_trigger(block) or
-                     TextBlockHelper.get_fold_lvl(block) > ref_lvl)):
-                block = block.previous()
+            scope = self._indexed_scope()
+            if scope is not None:
+                block = self._trigger.document().findBlockByNumber(
+                    max(scope[3], 0))
+            else:
+                block = self._trigger.previous()
+                ref_lvl = self.trigger_level - 1
+                while (block.blockNumber() and
+                        (not TextBlockHelper.is_fold_trigger(block) or
+                         TextBlockHelper.get_fold_lvl(block) > ref_lvl)):
+                    block = block.previous()
             try:
                 return FoldScope(block)
             except ValueError:
@@ -348,27 +567,28 @@ class FoldScope(object):
         """
         Find parent scope, if the block is not a fold trigger.
 
+        The parent trigger is looked up in the document fold index, there is
+        no limit on the distance between the block and its parent trigger.
+
         :param block: block from which the research will start
+        :return: the parent fold trigger, the block itself if it is a fold
+            trigger or the first block of the document if the block is not
+            in a fold scope.
         """
-        # if we moved up for more than n lines, just give up otherwise this
-        # would take too much time.
-        limit = 5000
-        counter = 0
         original = block
         if not TextBlockHelper.is_fold_trigger(block):
             # search level of next non blank line
             while block.text().strip() == '' and block.isValid():
                 block = block.next()
             ref_lvl = TextBlockHelper.get_fold_lvl(block) - 1
-            block = original
-            while (block.blockNumber() and counter < limit and
-                   (not TextBlockHelper.is_fold_trigger(block) or
-                    TextBlockHelper.get_fold_lvl(block) > ref_lvl)):
-                counter += 1
-                block = block.previous()
-        if counter < limit:
-            return block
-        return None
+            document = original.document()
+            triggers, scopes = _FoldIndex.get(document).scopes()
+            i = bisect.bisect_left(triggers, original.blockNumber()) - 1
+            nbr = triggers[i] if i >= 0 else -1
+            while nbr != -1 and scopes[nbr][0] > ref_lvl:
+                nbr = scopes[nbr][3]
+            block = document.findBlockByNumber(max(nbr, 0))
+        return block
 
     def __repr__(self):
         return 'FoldScope(start=%r, end=%d)' % self.get_range()
@@ -3,13 +3,14 @@ This module contains the syntax highlighter API.
 """
 import logging
 import sys
+from collections import OrderedDict
 import time
 import weakref
 from pygments.styles import get_style_by_name, get_all_styles
 from pygments.token import Token, Punctuation
 from pygments.util import ClassNotFound
 from pyqode.core.api.mode import Mode
-from pyqode.core.api.utils import drift_color
+from pyqode.core.api.utils import drift_color, TextBlockHelper
 from pyqode.qt import QtGui, QtCore, QtWidgets
 
 
@@ -17,8 +18,78 @@ def _logger():
     return logging.getLogger(__name__)
 
 
+def _escape_html(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace(
+        '>', '&gt;')
+
+
+def _html_style(fmt):
+    """
+    Returns the inline css style of a QTextCharFormat.
+    """
+    styles = []
+    brush = fmt.foreground()
+    if brush.style() != QtCore.Qt.NoBrush:
+        styles.append('color:%s' % brush.color().name())
+    brush = fmt.background()
+    if brush.style() != QtCore.Qt.NoBrush:
+        styles.append('background-color:%s' % brush.color().name())
+    if fmt.fontWeight() > QtGui.QFont.Normal:
+        styles.append('font-weight:bold')
+    if fmt.fontItalic():
+        styles.append('font-style:italic')
+    if fmt.fontUnderline():
+        styles.append('text-decoration:underline')
+    return ';'.join(styles)
+
+
+class _PygmentsStyles(object):
+    """
+    Sorted list of the available pygments styles.
+
+    The styles are only enumerated when the list is first used, enumerating
+    them loads all the pygments plugins.
+    """
+    def __init__(self, extra_styles=()):
+        self._extra_styles = list(extra_styles)
+        self._styles = None
+
+    def _get_styles(self):
+        if self._styles is None:
+            self._styles = sorted(
+                set(list(get_all_styles()) + self._extra_styles))
+        return self._styles
+
+    def __iter__(self):
+        return iter(self._get_styles())
+
+    def __len__(self):
+        return len(self._get_styles())
+
+    def __getitem__(self, index):
+        return self._get_styles()[index]
+
+    def __contains__(self, style):
+        return style in self._get_styles()
+
+    def __add__(self, other):
+        return self._get_styles() + list(other)
+
+    def __eq__(self, other):
+        return self._get_styles() == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self._get_styles())
+
+    def index(self, style):
+        return self._get_styles().index(style)
+
+
 #: A sorted list of available pygments styles, for convenience
-PYGMENTS_STYLES = sorted(set(list(get_all_styles()) + ['darcula', 'qt']))
+PYGMENTS_STYLES = _PygmentsStyles(['darcula', 'qt'])
 
 
 #: The list of color schemes keys (and their associated pygments token)
@@ -72,6 +143,31 @@ COLOR_SCHEME_KEYS = {
 }
 
 
+#: Pygments styles already looked up by :func:`_get_style_by_name` (None if
+#: the style was not found).
+_STYLES = {}
+
+
+def _get_style_by_name(name):
+    """
+    Cached version of ``pygments.styles.get_style_by_name``, which scans the
+    installed plugins each time a style is not a builtin style (e.g. 'qt').
+
+    :raises: ClassNotFound if the style does not exist.
+    """
+    try:
+        style = _STYLES[name]
+    except KeyError:
+        try:
+            style = get_style_by_name(name)
+        except ClassNotFound:
+            style = None
+        _STYLES[name] = style
+    if style is None:
+        raise ClassNotFound('Could not find style module %r.' % name)
+    return style
+
+
 class ColorScheme(object):
     """
     Translates a pygments style into a dictionary of colors associated with a
@@ -80,7 +176,13 @@ class ColorScheme(object):
     See :attr:`pyqode.core.api.syntax_highligter.COLOR_SCHEM_KEYS` for the
     available keys.
 
+    Color schemes are flyweights: ``ColorScheme(style)`` returns the same
+    instance for the same style, the formats are loaded only once and shared
+    by all the editors.
     """
+    #: Loaded color schemes, by class and style name
+    _instances = {}
+
     @property
     def name(self):
         """
@@ -105,17 +207,29 @@ class ColorScheme(object):
         """
         return self.formats['highlight'].background().color()
 
+    def __new__(cls, style):
+        try:
+            return cls._instances[(cls, style)]
+        except KeyError:
+            instance = super(ColorScheme, cls).__new__(cls)
+            instance._name = None
+            cls._instances[(cls, style)] = instance
+            return instance
+
     def __init__(self, style):
         """
         :param style: name of the pygments style to load
         """
+        if self._name is not None:
+            # shared instance, already loaded
+            return
         self._name = style
         self._brushes = {}
         #: Dictionary of formats colors (keys are the same as for
         #: :attr:`pyqode.core.api.COLOR_SCHEME_KEYS`
         self.formats = {}
         try:
-            style = get_style_by_name(style)
+            style = _get_style_by_name(style)
         except ClassNotFound:
             if style == 'darcula':
                 from pyqode.core.styles.darcula import DarculaStyle
@@ -214,6 +328,14 @@ class SyntaxHighlighter(QtGui.QSyntaxHighlighter, Mode):
         our data in the block user state as a bit-mask. You should always
         use :class:`pyqode.core.api.TextBlockHelper` to retrieve or modify
         those data.
+
+    Big documents are rehighlighted by chunks from the event loop (see
+    :meth:`rehighlight`), the visible blocks being highlighted first. Huge
+    documents can also be highlighted lazily, see :attr:`viewport_only`.
+
+    A document shared between split editors is highlighted once: the
+    highlighters of the clones delegate to the highlighter of the original
+    editor, see :meth:`share_document`.
     """
     #: Signal emitted at the start of highlightBlock. Parameters are the
     #: highlighter instance and the current text block
@@ -223,6 +345,63 @@ class SyntaxHighlighter(QtGui.QSyntaxHighlighter, Mode):
     #: highlighter instance and the current text block
     block_highlight_finished = QtCore.Signal(object, object)
 
+    #: Signal emitted after each chunk of a chunked rehighlight. Parameters
+    #: are the number of blocks highlighted so far and the total number of
+    #: blocks.
+    rehighlight_progress = QtCore.Signal(int, int)
+
+    #: Signal emitted when a chunked rehighlight finished.
+    rehighlight_finished = QtCore.Signal()
+
+    #: Documents with at least this number of blocks are rehighlighted by
+    #: chunks, smaller documents are rehighlighted at once.
+    CHUNKED_REHIGHLIGHT_THRESHOLD = 2000
+
+    #: Time (in seconds) spent highlighting blocks at each event loop
+    #: iteration during a chunked rehighlight.
+    CHUNK_DURATION = 0.02
+
+    #: Number of blocks highlighted above and below the viewport when
+    #: :attr:`viewport_only` is set.
+    VIEWPORT_MARGIN = 50
+
+    #: Maximum number of highlighted blocks when :attr:`viewport_only` is set,
+    #: the formats of the least recently shown blocks are dropped.
+    VIEWPORT_CACHE_SIZE = 5000
+
+    @property
+    def viewport_only(self):
+        """
+        Enables/Disables viewport-only highlighting.
+
+        When enabled, only the blocks that are near the viewport are
+        highlighted (on scroll and on edit) and the formats of the blocks that
+        have not been shown for a while are dropped. This keeps huge files
+        colourised at a constant memory and CPU cost. Multi-line constructs
+        that start outside the highlighted blocks are not detected.
+        """
+        return self._viewport_only
+
+    @viewport_only.setter
+    def viewport_only(self, value):
+        if value == self._viewport_only:
+            return
+        self._viewport_only = value
+        self._viewport_blocks.clear()
+        if self.editor:
+            if value:
+                self.editor.updateRequest.connect(self._on_update_request)
+            else:
+                self.editor.updateRequest.disconnect(self._on_update_request)
+
+    @property
+    def rehighlight_in_progress(self):
+        """
+        True while a chunked rehighlight is in progress, i.e. until
+        :attr:`rehighlight_finished` is emitted.
+        """
+        return self._rehighlight_timer.isActive()
+
     @property
     def formats(self):
         """
@@ -245,7 +424,12 @@ class SyntaxHighlighter(QtGui.QSyntaxHighlighter, Mode):
         if color_scheme.name != self._color_scheme.name:
             self._color_scheme = color_scheme
             self.refresh_editor(color_scheme)
-            self.rehighlight()
+            owner = self._document_owner()
+            if owner is not self:
+                # the formats of the shared document are the owner's ones
+                owner.color_scheme = color_scheme
+            else:
+                self.rehighlight()
 
     def refresh_editor(self, color_scheme):
         """
@@ -291,13 +475,31 @@ class SyntaxHighlighter(QtGui.QSyntaxHighlighter, Mode):
         #: to work. Default is None
         self.fold_detector = None
         self.WHITESPACES = QtCore.QRegExp(r'\s+')
+        # chunked rehighlight state: blocks at or after the cursor are not
+        # highlighted yet (except the one being highlighted by a chunk).
+        self._rehighlight_cursor = None
+        self._rehighlight_block_nbr = -1
+        self._rehighlight_start = 0
+        self._rehighlight_timer = QtCore.QTimer()
+        self._rehighlight_timer.setInterval(0)
+        self._rehighlight_timer.timeout.connect(self._rehighlight_chunk)
+        # viewport-only highlighting state: highlighted block numbers, least
+        # recently shown first.
+        self._viewport_only = False
+        self._viewport_blocks = OrderedDict()
+        self._viewport_update_pending = False
+        # weak reference to the highlighter of the editor we share our
+        # document with (None if we highlight the document ourselves)
+        self._owner = None
 
     def on_state_changed(self, state):
         if self._on_close:
             return
         if state:
-            self.setDocument(self.editor.document())
+            if self._document_owner() is self:
+                self.setDocument(self.editor.document())
         else:
+            self._stop_chunked_rehighlight()
             self.setDocument(None)
 
     def _highlight_whitespaces(self, text):
@@ -326,10 +528,27 @@ class SyntaxHighlighter(QtGui.QSyntaxHighlighter, Mode):
 
         :param text: text to highlight.
         """
+        if (self._viewport_only and self._rehighlight_block_nbr == -1 and
+                self.currentBlockState() & 0xFFFF == 0xFFFF):
+            # not highlighted yet, Qt calls us for each block of a new text:
+            # return as soon as possible (see _is_deferred)
+            return
         if not self.enabled:
             return
         current_block = self.currentBlock()
+        if self._is_deferred(current_block):
+            # the block will be highlighted by a later chunk, until then we
+            # keep its current formats (this also prevents QSyntaxHighlighter
+            # from highlighting the next blocks because the state changed).
+            if (not self._viewport_only or
+                    TextBlockHelper.get_state(current_block) != -1):
+                self._keep_formats(current_block)
+            return
         previous_block = self._find_prev_non_blank_block(current_block)
+        usd = current_block.userData()
+        if isinstance(usd, TextBlockUserData):
+            # formats are about to change
+            usd.html = None
         if self.editor:
             self.highlight_block(text, current_block)
             if self.editor.show_whitespaces:
@@ -350,38 +569,382 @@ class SyntaxHighlighter(QtGui.QSyntaxHighlighter, Mode):
 
     def rehighlight(self):
         """
-        Rehighlight the entire document, may be slow.
+        Rehighlight the entire document.
+
+        Documents smaller than :attr:`CHUNKED_REHIGHLIGHT_THRESHOLD` are
+        rehighlighted at once. Bigger documents are rehighlighted by chunks
+        from the event loop so that the editor remains responsive: the visible
+        blocks are highlighted first, then the whole document is processed
+        from the top, see :attr:`rehighlight_progress` and
+        :attr:`rehighlight_finished`.
         """
+        owner = self._document_owner()
+        if owner is not self:
+            owner.rehighlight()
+            return
+        self._stop_chunked_rehighlight()
+        try:
+            document = self.document()
+        except RuntimeError:
+            # document has been deleted
+            return
+        if document is None:
+            return
+        if self._viewport_only:
+            self._rehighlight_viewport_blocks()
+            return
+        if document.blockCount() >= self.CHUNKED_REHIGHLIGHT_THRESHOLD:
+            self._start_chunked_rehighlight(document)
+            return
         start = time.time()
         QtWidgets.QApplication.setOverrideCursor(
             QtGui.QCursor(QtCore.Qt.WaitCursor))
         try:
             super(SyntaxHighlighter, self).rehighlight()
         except RuntimeError:
-            # cloned widget, no need to rehighlight the same document twice ;)
+            # document has been deleted
             pass
         QtWidgets.QApplication.restoreOverrideCursor()
         end = time.time()
         _logger().debug('rehighlight duration: %fs' % (end - start))
 
+    def defer_highlighting(self):
+        """
+        Defers the highlighting of the whole document until the next call to
+        :meth:`rehighlight`.
+
+        This is used when setting a big text: QSyntaxHighlighter would
+        otherwise highlight it synchronously.
+        """
+        owner = self._document_owner()
+        if owner is not self:
+            owner.defer_highlighting()
+            return
+        self._stop_chunked_rehighlight()
+        try:
+            document = self.document()
+        except RuntimeError:
+            return
+        if document is not None:
+            self._rehighlight_cursor = self._make_rehighlight_cursor(document)
+
+    def share_document(self, highlighter):
+        """
+        Delegates the highlighting of the editor's document to the highlighter
+        of another editor that shares the same document (see
+        :meth:`pyqode.core.api.CodeEdit.split`), so that the document is
+        highlighted only once.
+
+        :param highlighter: highlighter of the editor we share our document
+            with. Pass None to highlight the document with this highlighter
+            again (e.g. when the original editor has been closed).
+        """
+        if highlighter is not None:
+            highlighter = highlighter._document_owner()
+            if highlighter is self:
+                return
+        self._stop_chunked_rehighlight()
+        if highlighter is not None:
+            self._owner = weakref.ref(highlighter)
+            self.setDocument(None)
+        else:
+            self._owner = None
+            if self.editor:
+                self.editor.document().setParent(self.editor)
+                if self.enabled:
+                    self.setDocument(self.editor.document())
+
+    def _document_owner(self):
+        """
+        Returns the highlighter that highlights our editor's document: self,
+        unless the document is shared with another (still open) editor.
+        """
+        owner = self._owner() if self._owner is not None else None
+        if owner is None or owner.editor is None:
+            return self
+        return owner
+
+    @staticmethod
+    def _make_rehighlight_cursor(document):
+        cursor = QtGui.QTextCursor(document)
+        # text inserted at the cursor position has not been highlighted yet
+        cursor.setKeepPositionOnInsert(True)
+        return cursor
+
+    def _is_deferred(self, block):
+        if block.blockNumber() == self._rehighlight_block_nbr:
+            return False
+        if self._viewport_only and TextBlockHelper.get_state(block) == -1:
+            # not highlighted yet, wait for the block to be shown
+            return True
+        cursor = self._rehighlight_cursor
+        return (cursor is not None and
+                block.blockNumber() >= cursor.blockNumber())
+
+    def _keep_formats(self, block):
+        layout = block.layout()
+        try:
+            ranges = layout.formats()
+        except AttributeError:
+            # Qt4
+            ranges = layout.additionalFormats()
+        for rng in ranges:
+            self.setFormat(rng.start, rng.length, rng.format)
+
+    def _highlight_now(self, block):
+        self._rehighlight_block_nbr = block.blockNumber()
+        try:
+            self.rehighlightBlock(block)
+        finally:
+            self._rehighlight_block_nbr = -1
+
+    def _start_chunked_rehighlight(self, document):
+        self._rehighlight_start = time.time()
+        self._rehighlight_cursor = self._make_rehighlight_cursor(document)
+        if self.editor:
+            # highlight the visible blocks first (their highlighting might be
+            # approximative until the chunks reach them).
+            block = self.editor.firstVisibleBlock()
+            nb_lines = (self.editor.viewport().height() //
+                        max(1, self.editor.fontMetrics().height()) + 1)
+            for i in range(nb_lines):
+                if not block.isValid():
+                    break
+                self._highlight_now(block)
+                block = block.next()
+            _logger().debug('rehighlight, visible blocks: %fs' %
+                            (time.time() - self._rehighlight_start))
+        self._rehighlight_timer.start()
+
+    def _on_update_request(self, *args):
+        if not self._viewport_update_pending:
+            # highlight after the current event (e.g. an edit or a paint)
+            self._viewport_update_pending = True
+            QtCore.QTimer.singleShot(0, self._highlight_viewport)
+
+    def _highlight_viewport(self):
+        """
+        Highlights the blocks near the viewport that have not been highlighted
+        yet, and drops the formats of the least recently shown blocks.
+        """
+        self._viewport_update_pending = False
+        if not self._viewport_only or not self.editor or not self.enabled:
+            return
+        # the viewport is ours but the document might be highlighted by the
+        # highlighter of another editor
+        highlighter = self._document_owner()
+        document = self.editor.document()
+        nb_lines = (self.editor.viewport().height() //
+                    max(1, self.editor.fontMetrics().height()) + 1)
+        first = max(0, self.editor.firstVisibleBlock().blockNumber() -
+                    self.VIEWPORT_MARGIN)
+        block = document.findBlockByNumber(first)
+        blocks = highlighter._viewport_blocks
+        for i in range(nb_lines + 2 * self.VIEWPORT_MARGIN):
+            if not block.isValid():
+                break
+            nbr = block.blockNumber()
+            blocks.pop(nbr, None)
+            blocks[nbr] = None
+            if TextBlockHelper.get_state(block) == -1:
+                highlighter._highlight_now(block)
+                if TextBlockHelper.get_state(block) == -1:
+                    # highlighters that do not use the block state
+                    TextBlockHelper.set_state(block, 0)
+            block = block.next()
+        while len(blocks) > self.VIEWPORT_CACHE_SIZE:
+            nbr, _ = blocks.popitem(last=False)
+            self._drop_formats(document.findBlockByNumber(nbr))
+
+    def _rehighlight_viewport_blocks(self):
+        """
+        Rehighlights the blocks that are highlighted in viewport-only mode.
+        """
+        document = self.document()
+        for nbr in list(self._viewport_blocks.keys()):
+            block = document.findBlockByNumber(nbr)
+            if block.isValid():
+                self._highlight_now(block)
+        self._on_update_request()
+
+    @staticmethod
+    def _drop_formats(block):
+        if not block.isValid():
+            return
+        layout = block.layout()
+        try:
+            layout.clearFormats()
+        except AttributeError:
+            # Qt4
+            layout.clearAdditionalFormats()
+        # keep the fold level and fold trigger flags
+        TextBlockHelper.set_state(block, -1)
+        usd = block.userData()
+        if isinstance(usd, TextBlockUserData):
+            usd.token_runs = None
+            usd.html = None
+
+    def _stop_chunked_rehighlight(self):
+        self._rehighlight_timer.stop()
+        self._rehighlight_cursor = None
+
+    def _rehighlight_chunk(self):
+        cursor = self._rehighlight_cursor
+        if cursor is None:
+            self._rehighlight_timer.stop()
+            return
+        try:
+            block = cursor.block()
+            deadline = time.time() + self.CHUNK_DURATION
+            # group the layout updates of the whole chunk
+            cursor.beginEditBlock()
+            try:
+                while block.isValid() and time.time() < deadline:
+                    self._highlight_now(block)
+                    block = block.next()
+                    if block.isValid():
+                        cursor.setPosition(block.position())
+            finally:
+                cursor.endEditBlock()
+        except RuntimeError:
+            # document has been deleted
+            self._stop_chunked_rehighlight()
+            return
+        self.rehighlight_progress.emit(
+            cursor.blockNumber(), cursor.document().blockCount())
+        if not block.isValid():
+            self._stop_chunked_rehighlight()
+            _logger().debug('rehighlight duration: %fs' %
+                            (time.time() - self._rehighlight_start))
+            self.rehighlight_finished.emit()
+
     def on_install(self, editor):
         super(SyntaxHighlighter, self).on_install(editor)
         self.refresh_editor(self.color_scheme)
         self.document().setParent(editor)
         self.setParent(editor)
+        if self._viewport_only:
+            editor.updateRequest.connect(self._on_update_request)
+
+    def on_uninstall(self):
+        self.viewport_only = False
+        self._stop_chunked_rehighlight()
+        super(SyntaxHighlighter, self).on_uninstall()
+        # stop highlighting a document that might still be used by a clone
+        self.setDocument(None)
 
     def clone_settings(self, original):
         self._color_scheme = original.color_scheme
+        self.viewport_only = original.viewport_only
+        self.share_document(original)
+
+    def to_html(self):
+        """
+        Exports the highlighted document as HTML (a ``pre`` element with
+        inline styles), using the formats computed by the highlighter.
+
+        The HTML fragment of each block is cached until the block is edited
+        or highlighted again, exporting a document after an edit only renders
+        the blocks that changed.
+
+        :return: html string
+        """
+        editor = self.editor
+        fragments = []
+        block = editor.document().firstBlock()
+        while block.isValid():
+            fragments.append(self._block_to_html(block))
+            block = block.next()
+        return '<pre style="%s">%s</pre>' % (
+            'color:%s;background-color:%s;font-family:%s' % (
+                editor.foreground.name(), editor.background.name(),
+                _escape_html(editor.font_name)), '\n'.join(fragments))
+
+    @staticmethod
+    def _block_to_html(block):
+        usd = block.userData()
+        if usd is None:
+            usd = TextBlockUserData()
+            block.setUserData(usd)
+        elif not isinstance(usd, TextBlockUserData):
+            usd = None
+        revision = block.revision()
+        if usd is not None and usd.html is not None and \
+                usd.html[0] == revision:
+            return usd.html[1]
+        text = block.text()
+        layout = block.layout()
+        try:
+            ranges = layout.formats()
+        except AttributeError:
+            # Qt4
+            ranges = layout.additionalFormats()
+        parts = []
+        pos = 0
+        for rng in sorted(ranges, key=lambda r: r.start):
+            start = max(pos, rng.start)
+            end = rng.start + rng.length
+            if end <= start:
+                continue
+            if start > pos:
+                parts.append(_escape_html(text[pos:start]))
+            style = _html_style(rng.format)
+            if style:
+                parts.append('<span style="%s">%s</span>' % (
+                    style, _escape_html(text[start:end])))
+            else:
+                parts.append(_escape_html(text[start:end]))
+            pos = end
+        parts.append(_escape_html(text[pos:]))
+        html = ''.join(parts)
+        if usd is not None:
+            usd.html = (revision, html)
+        return html
 
 
 class TextBlockUserData(QtGui.QTextBlockUserData):
     """
     Custom text block user data, mainly used to store checker messages and
     markers.
+
+    There is one instance per highlighted block, the known attributes are
+    slots and the lists are only created when first accessed.
     """
+    __slots__ = ('_messages', '_markers', 'token_runs', 'html')
+
     def __init__(self):
         super(TextBlockUserData, self).__init__()
-        #: List of checker messages associated with the block.
-        self.messages = []
-        #: List of markers draw by a marker panel.
-        self.markers = []
+        self._messages = None
+        self._markers = None
+        #: Token runs cached by the syntax highlighter (see
+        #: :class:`pyqode.core.modes.PygmentsSH`)
+        self.token_runs = None
+        #: (block revision, html fragment) cached by
+        #: :meth:`pyqode.core.api.SyntaxHighlighter.to_html`
+        self.html = None
+
+    @property
+    def messages(self):
+        """
+        List of checker messages associated with the block.
+        """
+        if self._messages is None:
+            self._messages = []
+        return self._messages
+
+    @messages.setter
+    def messages(self, value):
+        self._messages = value
+
+    @property
+    def markers(self):
+        """
+        List of markers draw by a marker panel.
+        """
+        if self._markers is None:
+            self._markers = []
+        return self._markers
+
+    @markers.setter
+    def markers(self, value):
+        self._markers = value
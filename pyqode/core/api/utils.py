@@ -902,7 +902,8 @@ class TextBlockHelper(object):
         """
         Gets the user state, generally used for syntax highlighting.
         :param block: block to access
-        :return: The block state
+        :return: The block state (-1 if the state has not been set or has been
+            set to -1).
 
         """
         if block is None:
@@ -910,7 +911,10 @@ class TextBlockHelper(object):
         state = block.userState()
         if state == -1:
             return state
-        return state & 0x0000FFFF
+        state &= 0x0000FFFF
+        if state == 0x0000FFFF:
+            return -1
+        return state
 
     @staticmethod
     def set_state(block, state):
@@ -19,6 +19,8 @@ A worker is always tightly coupled with its caller, so are the data.
 import logging
 import re
 import sys
+import threading
+import time
 import traceback
 
 
@@ -48,10 +50,32 @@ class CodeCompletionWorker(object):
 
         from pyqode.core.backend import CodeCompletionWorker
         CodeCompletionWorker.providers.insert(0, MyProvider())
+
+    All the providers run concurrently. Their results are merged: completions
+    of providers with a higher ``priority`` come first and, if two providers
+    return a completion with the same name, only the one of the provider
+    with the highest priority is kept (the first one in
+    :attr:`providers` if priorities are equal). A provider that does not
+    return within its time budget (its ``timeout`` attribute or
+    :attr:`timeout`) is skipped, and it is not called again until its
+    pending call returns (providers do not need to be thread safe).
+
+    The response is made up of the request context
+    ``(line, column, request_id, timings)``, where timings is the list of
+    ``(provider class name, time taken)`` (time is None if the provider
+    exceeded its time budget or was still busy), followed by the list of
+    merged completions.
     """
     #: The list of code completion provider to run on each completion request.
     providers = []
 
+    #: Default time budget of a provider, in seconds.
+    timeout = 5.0
+
+    #: Providers that exceeded their time budget and their thread, indexed by
+    #: provider id.
+    _busy = {}
+
     class Provider(object):
         """
         This class describes the expected interface for code completion
@@ -64,7 +88,18 @@ class CodeCompletionWorker(object):
             def complete(self, code, line, column, path, encoding, prefix):
                 pass
 
+        A provider may also define a ``priority`` (completions of providers
+        with a higher priority come first) and a ``timeout`` (time budget in
+        seconds).
+
+        .. note:: If a provider exceeds its time budget, it is skipped by
+            the next requests until its pending call returns.
         """
+        #: Priority of the provider completions.
+        priority = 0
+
+        #: Time budget of the provider, None to use the worker's default.
+        timeout = None
 
         def complete(self, code, line, column, path, encoding, prefix):
             """
@@ -101,20 +136,81 @@ class CodeCompletionWorker(object):
         encoding = data['encoding']
         prefix = data['prefix']
         req_id = data['request_id']
-        completions = []
+        args = (code, line, column, path, encoding, prefix)
+        start = time.time()
+        jobs = []
         for prov in CodeCompletionWorker.providers:
-            try:
-                results = prov.complete(
-                    code, line, column, path, encoding, prefix)
-                completions.append(results)
-                if len(completions):
-                    break
-            except:
-                sys.stderr.write('Failed to get completions from provider %r'
-                                 % prov)
-                exc1, exc2, exc3 = sys.exc_info()
-                traceback.print_exception(exc1, exc2, exc3, file=sys.stderr)
-        return [(line, column, req_id)] + completions
+            job = {'provider': prov, 'completions': [], 'time': None}
+            if self._is_busy(prov):
+                sys.stderr.write('Provider %r is still busy, skipped' % prov)
+                jobs.append((None, job))
+                continue
+            thread = threading.Thread(target=self._run_provider,
+                                      args=(job, args))
+            thread.daemon = True
+            thread.start()
+            jobs.append((thread, job))
+        timings = []
+        done = []
+        for thread, job in jobs:
+            prov = job['provider']
+            if thread is None:
+                timings.append((prov.__class__.__name__, None))
+                continue
+            timeout = getattr(prov, 'timeout', None)
+            if timeout is None:
+                timeout = self.timeout
+            thread.join(max(0, start + timeout - time.time()))
+            if thread.is_alive():
+                sys.stderr.write('Provider %r exceeded its time budget (%ss)'
+                                 % (prov, timeout))
+                CodeCompletionWorker._busy[id(prov)] = (prov, thread)
+                timings.append((prov.__class__.__name__, None))
+            else:
+                timings.append((prov.__class__.__name__, job['time']))
+                done.append(job)
+        done.sort(key=lambda job: -getattr(job['provider'], 'priority', 0))
+        completions = []
+        names = set()
+        for job in done:
+            for completion in job['completions'] or []:
+                if completion['name'] not in names:
+                    names.add(completion['name'])
+                    completions.append(completion)
+        return [(line, column, req_id, timings), completions]
+
+    @staticmethod
+    def _is_busy(prov):
+        """
+        Checks if a provider that exceeded its time budget is still running.
+        """
+        try:
+            busy_prov, thread = CodeCompletionWorker._busy[id(prov)]
+        except KeyError:
+            return False
+        if busy_prov is prov and thread.is_alive():
+            return True
+        del CodeCompletionWorker._busy[id(prov)]
+        return False
+
+    @staticmethod
+    def _run_provider(job, args):
+        """
+        Runs a provider and stores its results and the time it took in the
+        job dict.
+        """
+        prov = job['provider']
+        start = time.time()
+        try:
+            completions = prov.complete(*args)
+        except:
+            sys.stderr.write('Failed to get completions from provider %r'
+                             % prov)
+            exc1, exc2, exc3 = sys.exc_info()
+            traceback.print_exception(exc1, exc2, exc3, file=sys.stderr)
+        else:
+            job['completions'] = completions
+        job['time'] = time.time() - start
 
 
 class DocumentWordsProvider(object):
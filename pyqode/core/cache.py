@@ -11,7 +11,7 @@ file so that we can reuse it automatically next time the user want to
 open the same file.
 
 We also use this to cache some editor states (such as the last cursor position
-for a specific file path)
+or the collapsed fold scopes for a specific file path)
 
 We do not store editor styles and settings here. Those kind of settings are
 better handled at the application level.
@@ -150,6 +150,45 @@ class Cache(object):
         map[path] = position
         self._settings.setValue('cachedCursorPosition', json.dumps(map))
 
+    def get_fold_state(self, file_path):
+        """
+        Gets the cached fold state for file_path
+
+        :param file_path: path of the file in the cache
+        :return: tuple made up of the list of collapsed fold trigger lines
+            and the fingerprint of the content they apply to, or ([], None)
+        """
+        try:
+            map = json.loads(self._settings.value('cachedFoldState'))
+        except TypeError:
+            map = {}
+        try:
+            fingerprint, lines = map[file_path]
+        except (KeyError, TypeError, ValueError):
+            return [], None
+        return lines, fingerprint
+
+    def set_fold_state(self, path, lines, fingerprint):
+        """
+        Cache the fold state for the specified file path.
+
+        :param path: path of the file to cache
+        :param lines: list of collapsed fold trigger lines, an empty list
+            removes the file from the cache.
+        :param fingerprint: fingerprint of the content the lines apply to
+        """
+        try:
+            map = json.loads(self._settings.value('cachedFoldState'))
+        except TypeError:
+            map = {}
+        if lines:
+            map[path] = [fingerprint, lines]
+        elif path in map:
+            del map[path]
+        else:
+            return
+        self._settings.setValue('cachedFoldState', json.dumps(map))
+
 
 def _logger():
     return logging.getLogger(__name__)
@@ -1,9 +1,11 @@
 """
 This module contains the backend controller
 """
+import inspect
 import logging
 import socket
 import sys
+import time
 from pyqode.qt import QtCore
 
 from pyqode.core.api.client import JsonTcpClient, BackendProcess
@@ -34,12 +36,22 @@ class BackendManager(Manager):
         - start
         - stop
         - send_request
+        - send_adaptive_request
 
     """
     LAST_PORT = None
     LAST_PROCESS = None
     SHARE_COUNT = 0
 
+    #: Initial size limit (in characters) under which
+    #: :meth:`send_adaptive_request` runs jobs in process. The limit is then
+    #: tuned from the measured round-trip time of the backend.
+    LOCAL_JOB_SIZE_LIMIT = 50000
+
+    #: Maximum time (in seconds) an in-process job may block the gui thread,
+    #: whatever the backend round-trip time is.
+    MAX_LOCAL_JOB_DURATION = 0.05
+
     def __init__(self, editor):
         super(BackendManager, self).__init__(editor)
         self._process = None
@@ -52,6 +64,12 @@ class BackendManager(Manager):
         self._heartbeat_timer.setInterval(1000)
         self._heartbeat_timer.timeout.connect(self._send_heartbeat)
         self._heartbeat_timer.start()
+        #: Size limit (in characters) under which adaptive requests are run
+        #: in process, see :meth:`send_adaptive_request`.
+        self.local_job_size_limit = self.LOCAL_JOB_SIZE_LIMIT
+        self._round_trip_time = None
+        self._local_time_per_char = None
+        self._timed_sockets = {}
 
     @staticmethod
     def pick_free_port():
@@ -142,6 +160,7 @@ class BackendManager(Manager):
             s.close()
 
         self._sockets[:] = []
+        self._timed_sockets.clear()
         # prevent crash logs from being written if we are busy killing
         # the process
         self._process._prevent_logs = True
@@ -192,6 +211,81 @@ class BackendManager(Manager):
             self._sockets.append(socket)
             # restart heartbeat timer
             self._heartbeat_timer.start()
+            return socket
+
+    def send_adaptive_request(self, worker_class_or_function, args, size,
+                              on_receive=None):
+        """
+        Runs a job in process if ``size`` is below
+        :attr:`local_job_size_limit`, otherwise sends it to the backend
+        exactly like :meth:`send_request` does.
+
+        Small jobs are faster to run locally than to serialise and send to
+        the backend process. The size limit is tuned after each job, using
+        the measured backend round-trip time and the measured cost of
+        local jobs, so that a local job never costs more than a round-trip
+        (nor more than :attr:`MAX_LOCAL_JOB_DURATION`).
+
+        .. note:: Only use this with workers that do not depend on the
+            server environment, e.g.
+            :func:`pyqode.core.backend.workers.findall`.
+
+        :param worker_class_or_function: Worker class or function
+        :param args: worker args, any Json serializable objects
+        :param size: size of the job, usually the length of the text to
+            process.
+        :param on_receive: an optional callback executed with the worker's
+            results.
+
+        :raise: backend.NotRunning if the job must be sent to the backend and
+            the backend process is not running.
+        """
+        if size < self.local_job_size_limit:
+            worker = worker_class_or_function
+            if inspect.isclass(worker):
+                worker = worker()
+            start = time.time()
+            try:
+                results = worker(args)
+            except Exception:
+                # same as the server: log the error and return no results
+                _logger().exception('failed to run job %r in process',
+                                    worker_class_or_function)
+                results = []
+            else:
+                self._update_local_time(time.time() - start, size)
+            if results is None:
+                results = []
+            if on_receive:
+                on_receive(results)
+        else:
+            socket = self.send_request(
+                worker_class_or_function, args, on_receive=on_receive)
+            self._timed_sockets[socket] = time.time()
+
+    @staticmethod
+    def _moving_average(average, value):
+        if average is None:
+            return value
+        return 0.8 * average + 0.2 * value
+
+    def _update_local_time(self, elapsed, size):
+        if size:
+            self._local_time_per_char = self._moving_average(
+                self._local_time_per_char, elapsed / float(size))
+            self._update_local_job_size_limit()
+
+    def _update_round_trip_time(self, elapsed):
+        self._round_trip_time = self._moving_average(
+            self._round_trip_time, elapsed)
+        self._update_local_job_size_limit()
+
+    def _update_local_job_size_limit(self):
+        if self._round_trip_time is None or not self._local_time_per_char:
+            return
+        budget = min(self._round_trip_time, self.MAX_LOCAL_JOB_DURATION)
+        self.local_job_size_limit = int(budget / self._local_time_per_char)
+        comm('local job size limit: %d', self.local_job_size_limit)
 
     def _send_heartbeat(self):
         try:
@@ -200,6 +294,12 @@ class BackendManager(Manager):
             self._heartbeat_timer.stop()
 
     def _rm_socket(self, socket):
+        try:
+            start = self._timed_sockets.pop(socket)
+        except KeyError:
+            pass
+        else:
+            self._update_round_trip_time(time.time() - start)
         try:
             socket.close()
             self._sockets.remove(socket)
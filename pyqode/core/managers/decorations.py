@@ -1,8 +1,11 @@
 """
 Contains the text decorations manager
 """
+import bisect
+import contextlib
 import logging
 from pyqode.core.api.manager import Manager
+from pyqode.qt import QtCore, QtWidgets
 
 
 def _logger():
@@ -13,10 +16,49 @@ class TextDecorationsManager(Manager):
     """
     Manages the collection of TextDecoration that have been set on the editor
     widget.
+
+    Decorations are kept sorted by draw order. Use :meth:`batch` to add or
+    remove many decorations at once: the editor extra selections are then
+    updated only once, at the end of the batch.
+
+    Only the decorations that intersect the visible blocks (plus
+    :attr:`VIEWPORT_MARGIN` blocks above and below) are handed to Qt, the
+    extra selections are updated when the editor is scrolled or resized
+    past that margin (for QPlainTextEdit based editors only, all
+    decorations are handed to QTextEdit based editors).
+
+    .. note:: The decorations are indexed by position when they are added,
+        do not move their cursor once they have been added (remove the
+        decoration, move its cursor and add it again instead).
     """
+    #: Number of blocks above and below the viewport whose decorations are
+    #: handed to Qt.
+    VIEWPORT_MARGIN = 50
+
     def __init__(self, editor):
         super(TextDecorationsManager, self).__init__(editor)
+        #: all decorations, sorted by draw order
         self._decorations = []
+        #: sort keys (draw order, insertion count) of the decorations (in the
+        #: same order), for bisect
+        self._keys = []
+        #: sort key of each decoration
+        self._key = {}
+        self._count = 0
+        #: decorations sorted by selection start. Text cursors keep their
+        #: relative order when the document is edited, so this list remains
+        #: sorted without being updated.
+        self._by_start = []
+        #: decorations whose selection spans several blocks
+        self._multi_block = set()
+        self._batch_depth = 0
+        self._pending = False
+        #: first and last block numbers of the decorations handed to Qt
+        self._window = None
+        self._culling = isinstance(editor, QtWidgets.QPlainTextEdit)
+        if self._culling:
+            editor.updateRequest.connect(self._on_update_request)
+            editor.blockCountChanged.connect(self._on_block_count_changed)
 
     def append(self, decoration):
         """
@@ -25,13 +67,21 @@ class TextDecorationsManager(Manager):
         :param decoration: Text decoration to add
         :type decoration: pyqode.core.api.TextDecoration
         """
-        if decoration not in self._decorations:
-            self._decorations.append(decoration)
-            self._decorations = sorted(
-                self._decorations, key=lambda sel: sel.draw_order)
-            self.editor.setExtraSelections(self._decorations)
-            return True
-        return False
+        if decoration in self._key:
+            return False
+        key = (decoration.draw_order, self._count)
+        self._count += 1
+        index = bisect.bisect_right(self._keys, key)
+        self._decorations.insert(index, decoration)
+        self._keys.insert(index, key)
+        self._key[decoration] = key
+        cursor = decoration.cursor
+        self._by_start.insert(
+            self._first_starting_after(cursor.selectionStart()), decoration)
+        if self._spans_several_blocks(cursor):
+            self._multi_block.add(decoration)
+        self._update()
+        return True
 
     def remove(self, decoration):
         """
@@ -41,11 +91,182 @@ class TextDecorationsManager(Manager):
         :type decoration: pyqode.core.api.TextDecoration
         """
         try:
-            self._decorations.remove(decoration)
-            self.editor.setExtraSelections(self._decorations)
-            return True
-        except ValueError:
+            key = self._key.pop(decoration)
+        except KeyError:
             return False
+        index = bisect.bisect_left(self._keys, key)
+        del self._decorations[index]
+        del self._keys[index]
+        self._multi_block.discard(decoration)
+        try:
+            index = self._by_start.index(
+                decoration, self._first_starting_after(
+                    decoration.cursor.selectionStart() - 1))
+        except ValueError:
+            # the decoration cursor has been moved
+            self._by_start.remove(decoration)
+        else:
+            del self._by_start[index]
+        self._update()
+        return True
+
+    def refresh(self):
+        """
+        Re-applies the text decorations on the editor, use it when the format
+        of some decorations have been changed.
+        """
+        self._update()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context manager that defers the update of the editor extra selections
+        until the end of the block::
+
+            with editor.decorations.batch():
+                for deco in decorations:
+                    editor.decorations.append(deco)
+
+        Batches can be nested, the extra selections are updated when the
+        outermost batch ends.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._pending:
+                self._update()
+
+    def at_position(self, position):
+        """
+        Returns the decorations whose selection contains the specified
+        position, sorted by draw order.
+
+        :param position: text position (as returned by
+            QTextCursor.position)
+        """
+        try:
+            block = self.editor.document().findBlock(position)
+        except RuntimeError:
+            return []
+        return self._intersecting(block.position(), position, position)
+
+    def at_cursor(self, cursor):
+        """
+        Returns the decorations that contain the text cursor (see
+        :meth:`pyqode.core.api.TextDecoration.contains_cursor`), sorted by
+        draw order.
+
+        This is used to find the decorations under the mouse cursor (tooltips
+        and clicks) without testing every decoration.
+
+        :param cursor: QTextCursor
+        """
+        return [deco for deco in self.at_position(cursor.position())
+                if deco.contains_cursor(cursor)]
+
+    def _first_starting_after(self, position):
+        """
+        Returns the index of the first decoration (in :attr:`_by_start`) that
+        starts after position.
+        """
+        by_start = self._by_start
+        lo, hi = 0, len(by_start)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if by_start[mid].cursor.selectionStart() <= position:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    @staticmethod
+    def _spans_several_blocks(cursor):
+        return cursor.document().findBlock(
+            cursor.selectionEnd()).position() > cursor.selectionStart()
+
+    def _intersecting(self, block_start, start, end):
+        """
+        Returns the decorations (sorted by draw order) whose selection
+        intersects [start, end].
+
+        :param block_start: position of the block that contains start. Only
+            the decorations that span several blocks may start before it.
+        """
+        by_start = self._by_start
+        found = []
+        i = self._first_starting_after(block_start - 1)
+        while i < len(by_start):
+            deco = by_start[i]
+            cursor = deco.cursor
+            if cursor.selectionStart() > end:
+                break
+            if cursor.selectionEnd() >= start:
+                found.append(deco)
+            i += 1
+        for deco in self._multi_block:
+            cursor = deco.cursor
+            if (cursor.selectionStart() < block_start and
+                    cursor.selectionEnd() >= start):
+                found.append(deco)
+        keys = self._key
+        found.sort(key=lambda deco: keys[deco])
+        return found
+
+    def _visible_block_range(self):
+        editor = self.editor
+        first = editor.firstVisibleBlock().blockNumber()
+        last = editor.cursorForPosition(QtCore.QPoint(
+            0, editor.viewport().height())).blockNumber()
+        return first, last
+
+    def _update(self):
+        if self._batch_depth:
+            self._pending = True
+            return
+        self._pending = False
+        editor = self.editor
+        try:
+            if not self._culling:
+                editor.setExtraSelections(self._decorations)
+                return
+            first, last = self._visible_block_range()
+            first = max(0, first - self.VIEWPORT_MARGIN)
+            last += self.VIEWPORT_MARGIN
+            document = editor.document()
+            first_block = document.findBlockByNumber(first)
+            last_block = document.findBlockByNumber(last)
+            if last_block.isValid():
+                end = last_block.position() + last_block.length()
+            else:
+                end = document.characterCount()
+            decorations = self._intersecting(
+                first_block.position(), first_block.position(), end)
+            for deco in decorations:
+                # the selection may have been extended to several blocks by
+                # an edit
+                if (deco not in self._multi_block and
+                        self._spans_several_blocks(deco.cursor)):
+                    self._multi_block.add(deco)
+            self._window = first, last
+            editor.setExtraSelections(decorations)
+        except RuntimeError:
+            # editor has been deleted
+            self._window = None
+
+    def _on_update_request(self, *args):
+        if self._window is None or self._batch_depth:
+            return
+        first, last = self._visible_block_range()
+        if first < self._window[0] or last > self._window[1]:
+            self._update()
+
+    def _on_block_count_changed(self):
+        # the decorations of the blocks that moved into the window have not
+        # been handed to Qt
+        if self._window is not None and not self._batch_depth:
+            self._update()
 
     def clear(self):
         """
@@ -53,13 +274,17 @@ class TextDecorationsManager(Manager):
 
         """
         self._decorations[:] = []
-        try:
-            self.editor.setExtraSelections(self._decorations)
-        except RuntimeError:
-            pass
+        self._keys[:] = []
+        self._key.clear()
+        self._by_start[:] = []
+        self._multi_block.clear()
+        self._update()
 
     def __iter__(self):
         return iter(self._decorations)
 
     def __len__(self):
         return len(self._decorations)
+
+    def __contains__(self, decoration):
+        return decoration in self._key
@@ -11,6 +11,7 @@ import locale
 import logging
 import mimetypes
 import os
+import zlib
 from pyqode.core.api.manager import Manager
 from pyqode.core.api.utils import TextHelper
 from pyqode.qt import QtCore, QtWidgets
@@ -132,8 +133,10 @@ class FileManager(Manager):
     def file_size_limit(self):
         """
         Returns the file size limit. If the size of the file to open
-        is superior to the limit, then we disabled syntax highlighting, code
-        folding,... to improve the load time and the runtime performances.
+        is superior to the limit, then we disabled code folding,... and
+        only highlight the visible text (see
+        :attr:`pyqode.core.api.SyntaxHighlighter.viewport_only`) to improve
+        the load time and the runtime performances.
 
         Default is 10MB.
         """
@@ -174,6 +177,12 @@ class FileManager(Manager):
         #: True to restore cursor position (if the document has already been
         # opened once).
         self.restore_cursor = True
+        #: True to restore the collapsed fold scopes (if the document has
+        #: already been opened once and did not change since then).
+        self.restore_fold_state = True
+        #: (highlighter, callback) of the fold state restore that waits for the
+        #: end of a chunked rehighlight, see :meth:`_restore_fold_state`.
+        self._pending_fold_restore = None
         #: Preferred EOL convention. This setting will be used for saving the
         #: document unles autodetect_eol is True.
         self._preferred_eol = self.EOL.System
@@ -224,6 +233,7 @@ class FileManager(Manager):
         ret_val = False
         if encoding is None:
             encoding = locale.getpreferredencoding()
+        self._cancel_fold_restore()
         self.opening = True
         settings = Cache()
         self._path = path
@@ -237,9 +247,23 @@ class FileManager(Manager):
             else:
                 encoding = cached_encoding
         enable_modes = os.path.getsize(path) < self._limit
+        highlighter = self.editor.syntax_highlighter
         for m in self.editor.modes:
-            if m.enabled:
+            if m.enabled and m is not highlighter:
                 m.enabled = enable_modes
+        if highlighter is not None:
+            # big files are only highlighted around the viewport
+            highlighter.viewport_only = not enable_modes
+        try:
+            folding_panel = self.editor.panels.get('FoldingPanel')
+        except KeyError:
+            pass
+        else:
+            # fold scopes need the fold levels of the whole document, which
+            # are not known when only the viewport is highlighted
+            if folding_panel.enabled:
+                folding_panel.enabled = enable_modes
+                folding_panel.setVisible(enable_modes)
         # open file and get its content
         try:
             with open(path, 'Ur', encoding=encoding) as file:
@@ -277,6 +301,8 @@ class FileManager(Manager):
         self.opening = False
         if self.restore_cursor:
             self._restore_cached_pos()
+        if ret_val and self.restore_fold_state:
+            self._restore_fold_state(content)
         self._check_for_readonly()
         return ret_val
 
@@ -294,6 +320,63 @@ class FileManager(Manager):
         self.editor.setTextCursor(tc)
         QtCore.QTimer.singleShot(1, self.editor.centerCursor)
 
+    @staticmethod
+    def _fingerprint(text):
+        return zlib.crc32(text.encode('utf-8', 'replace')) & 0xffffffff
+
+    def _restore_fold_state(self, content):
+        lines, fingerprint = Cache().get_fold_state(self.path)
+        if not lines or fingerprint != self._fingerprint(content):
+            return
+        try:
+            panel = self.editor.panels.get('FoldingPanel')
+        except KeyError:
+            return
+        highlighter = self.editor.syntax_highlighter
+        if highlighter is None or highlighter.viewport_only:
+            # fold levels are only known once the whole document has been
+            # highlighted
+            return
+        if highlighter.rehighlight_in_progress:
+            def restore():
+                self._cancel_fold_restore()
+                panel.set_collapsed_lines(lines)
+            highlighter.rehighlight_finished.connect(restore)
+            self._pending_fold_restore = highlighter, restore
+        else:
+            panel.set_collapsed_lines(lines)
+
+    def _cancel_fold_restore(self):
+        if self._pending_fold_restore is None:
+            return
+        highlighter, restore = self._pending_fold_restore
+        self._pending_fold_restore = None
+        try:
+            highlighter.rehighlight_finished.disconnect(restore)
+        except (RuntimeError, TypeError):
+            # highlighter already deleted
+            pass
+
+    def _cache_fold_state(self):
+        if not self.path:
+            return
+        highlighter = self.editor.syntax_highlighter
+        try:
+            panel = self.editor.panels.get('FoldingPanel')
+        except KeyError:
+            lines = []
+        else:
+            if not panel.enabled or (highlighter is not None and
+                                     highlighter.viewport_only):
+                # no fold scopes to save (and computing them would require
+                # the fold levels of the whole document)
+                return
+            lines = panel.collapsed_lines()
+        fingerprint = None
+        if lines:
+            fingerprint = self._fingerprint(self.editor.toPlainText())
+        Cache().set_fold_state(self.path, lines, fingerprint)
+
     def reload(self, encoding):
         """
         Reload the file with another encoding.
@@ -434,6 +517,8 @@ class FileManager(Manager):
         """
         Cache().set_cursor_position(
             self.path, self.editor.textCursor().position())
+        self._cancel_fold_restore()
+        self._cache_fold_state()
         self.editor._original_text = ''
         if clear:
             self.editor.clear()
@@ -446,3 +531,4 @@ class FileManager(Manager):
         self.safe_save = original.replace_tabs_by_spaces
         self.clean_trailing_whitespaces = original.clean_trailing_whitespaces
         self.restore_cursor = original.restore_cursor
+        self.restore_fold_state = original.restore_fold_state
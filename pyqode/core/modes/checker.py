@@ -94,6 +94,19 @@ class CheckerMessage(object):
     def __str__(self):
         return "{0} l{1}".format(self.description, self.line)
 
+    @property
+    def key(self):
+        """
+        Hashable identity of the message: (line, column, description,
+        status). The line is read from the message block when it is known
+        (the block follows the text edits).
+        """
+        if self.block is not None and self.block.isValid():
+            line = self.block.blockNumber()
+        else:
+            line = self.line
+        return line, self.col, self.description, self.status
+
     def __eq__(self, other):
         return (self.block == other.block and
                 self.description == other.description)
@@ -137,6 +150,27 @@ class CheckerMode(Mode, QtCore.QObject):
 
     Messages are displayed as text decorations on the editor. A checker panel
     will take care of display message icons next to each line.
+
+    **Incremental checking**
+
+    When :attr:`incremental` is True, the request data also contains a
+    ``'region'`` item: the range of lines (``[first, last]``, 0 based,
+    inclusive) that have been edited since the previous request. The region
+    is absent when no edit has been tracked (e.g. for the first analysis),
+    all lines must then be checked. The whole code is still sent so that the
+    worker has the context of the region.
+
+    The worker may then check the region only and return a dict instead of a
+    list of messages:
+
+    .. code-block:: python
+
+        {'region': data['region'], 'messages': [(description, status, line),
+                                                ...]}
+
+    The messages outside of the region are kept (their line number follows
+    the text edits) and merged with the messages of the region. A worker
+    that returns a list of messages always replaces all the messages.
     """
     @property
     def messages(self):
@@ -147,7 +181,7 @@ class CheckerMode(Mode, QtCore.QObject):
 
     def __init__(self, worker,
                  delay=500,
-                 show_tooltip=True):
+                 show_tooltip=True, incremental=False):
         """
         :param worker: The process function or class to call remotely.
         :param delay: The delay used before running the analysis process when
@@ -155,19 +189,31 @@ class CheckerMode(Mode, QtCore.QObject):
                       :class:pyqode.core.modes.CheckerTriggers`
         :param show_tooltip: Specify if a tooltip must be displayed when the
                              mouse is over a checker message decoration.
+        :param incremental: True to send the edited region to the worker (see
+                            :attr:`incremental`).
         """
         Mode.__init__(self)
         QtCore.QObject.__init__(self)
-        # max number of messages to keep good performances
-        self.limit = 200
+        #: Maximum number of messages to display, None to display all
+        #: messages.
+        self.limit = None
         self.ignore_rules = []
         self._job_runner = DelayJobRunner(delay=delay)
         self._messages = []
         self._worker = worker
         self._mutex = QtCore.QMutex()
         self._show_tooltip = show_tooltip
+        #: (region, messages) batches waiting to be displayed, region is None
+        #: for a full set of messages
         self._pending_msg = []
         self._finished = True
+        #: Sends the region edited since the previous request to the worker,
+        #: which may only check that region (see the class documentation).
+        self.incremental = incremental
+        #: cursors at the start and at the end of the region edited since the
+        #: previous request, they follow the text edits
+        self._dirty = None
+        self._document = None
 
     def set_ignore_rules(self, rules):
         """
@@ -180,77 +226,134 @@ class CheckerMode(Mode, QtCore.QObject):
 
     def add_messages(self, messages):
         """
-        Adds a message or a list of message.
+        Sets the messages to display, replacing the previous ones.
+
+        The new messages are reconciled with the displayed ones on the next
+        event loop iteration: messages that did not change (same
+        :attr:`CheckerMessage.key`) are kept, the others are removed and the
+        new ones are added, in a single decoration batch.
 
         :param messages: A list of messages or a single message
         """
-        # remove old messages
-        if len(messages) > self.limit:
+        if self.limit is not None and len(messages) > self.limit:
             messages = messages[:self.limit]
         _logger(self.__class__).log(5, 'adding %s messages' % len(messages))
+        self._queue_messages(None, messages)
+
+    def _merge_messages(self, region, messages):
+        """
+        Replaces the messages of a region ([first, last] line numbers) by the
+        new messages of that region, the messages outside of the region are
+        kept.
+        """
+        _logger(self.__class__).log(
+            5, 'merging %s messages in lines %s' % (len(messages), region))
+        self._queue_messages(region, messages)
+
+    def _queue_messages(self, region, messages):
+        """
+        Queues a batch of messages, the pending batches are displayed in
+        order on the next event loop iteration.
+        """
         self._finished = False
-        self._new_messages = messages
-        self._to_check = list(self._messages)
-        self._pending_msg = messages
-        # start removing messages, new message won't be added until we
-        # checked all message that need to be removed
-        QtCore.QTimer.singleShot(1, self._remove_batch)
-
-    def _remove_batch(self):
-        if self.editor is None:
+        scheduled = bool(self._pending_msg)
+        if region is None:
+            # a full set of messages replaces the result of the pending
+            # batches
+            del self._pending_msg[:]
+        self._pending_msg.append((region, list(messages)))
+        if not scheduled:
+            QtCore.QTimer.singleShot(1, self._apply_messages)
+
+    def _apply_messages(self):
+        pending, self._pending_msg = self._pending_msg, []
+        if self.editor is None or not pending:
             return
-        for i in range(100):
-            if not len(self._to_check):
-                # all messages checker, start adding messages now
-                QtCore.QTimer.singleShot(1, self._add_batch)
-                self.editor.repaint()
-                return False
-            msg = self._to_check.pop(0)
-            if msg.block is None:
-                msg.block = self.editor.document().findBlockByNumber(msg.line)
-            if msg not in self._new_messages:
-                self.remove_message(msg)
+        with self.editor.decorations.batch():
+            for region, messages in pending:
+                self._reconcile_messages(region, messages)
+        self._finished = True
+        _logger(self.__class__).log(5, 'finished')
         self.editor.repaint()
-        QtCore.QTimer.singleShot(1, self._remove_batch)
 
-    def _add_batch(self):
-        if self.editor is None:
-            return
-        for i in range(10):
-            if not len(self._pending_msg):
-                # all pending message added
-                self._finished = True
-                _logger(self.__class__).log(5, 'finished')
-                self.editor.repaint()
-                return False
-            message = self._pending_msg.pop(0)
+    def _reconcile_messages(self, region, messages):
+        """
+        Replaces the displayed messages (of region, or all of them if region
+        is None) by the new messages, messages that did not change are kept.
+        """
+        document = self.editor.document()
+        new_keys = set()
+        for message in messages:
             if message.line >= 0:
-                try:
-                    usd = message.block.userData()
-                except AttributeError:
-                    message.block = self.editor.document().findBlockByNumber(message.line)
-                    usd = message.block.userData()
-                if usd is None:
-                    usd = TextBlockUserData()
-                    message.block.setUserData(usd)
-                # check if the same message already exists
-                if message in usd.messages:
+                if message.block is None:
+                    message.block = document.findBlockByNumber(message.line)
+                new_keys.add(message.key)
+        # remove the messages that are not reported anymore
+        kept = {}
+        retained = []
+        for message in self._messages:
+            if region is not None and message.block.isValid():
+                line = message.block.blockNumber()
+                if not region[0] <= line <= region[1]:
+                    # outside of the checked region, its line follows the
+                    # text edits
+                    message.line = line
+                    retained.append(message)
                     continue
-                self._messages.append(message)
-                usd.messages.append(message)
-                tooltip = None
-                if self._show_tooltip:
-                    tooltip = message.description
-                message.decoration = TextDecoration(
-                    self.editor.textCursor(), start_line=message.line,
-                    tooltip=tooltip, draw_order=3)
-                message.decoration.set_full_width()
-                message.decoration.set_as_error(color=QtGui.QColor(
-                    message.color))
-                self.editor.decorations.append(message.decoration)
-        QtCore.QTimer.singleShot(1, self._add_batch)
-        self.editor.repaint()
-        return True
+            key = message.key
+            if key in new_keys and key not in kept:
+                # the key line is read from the message block, which follows
+                # the text edits
+                message.line = key[0]
+                kept[key] = message
+            else:
+                self._discard_message(message)
+        self._messages = retained + list(kept.values())
+        # add the new ones
+        for message in messages:
+            if message.line < 0:
+                continue
+            key = message.key
+            if key in kept:
+                continue
+            kept[key] = message
+            self._add_message(message)
+
+    def _add_message(self, message):
+        usd = message.block.userData()
+        if usd is None:
+            usd = TextBlockUserData()
+            message.block.setUserData(usd)
+        self._messages.append(message)
+        usd.messages.append(message)
+        tooltip = None
+        if self._show_tooltip:
+            tooltip = message.description
+        message.decoration = TextDecoration(
+            self.editor.textCursor(), start_line=message.line,
+            tooltip=tooltip, draw_order=3)
+        message.decoration.set_full_width()
+        message.decoration.set_as_error(color=QtGui.QColor(message.color))
+        self.editor.decorations.append(message.decoration)
+
+    def _discard_message(self, message):
+        """
+        Removes the message from its block user data and removes its
+        decoration (the message is not removed from :attr:`messages`).
+        """
+        usd = message.block.userData() if message.block is not None else None
+        if usd:
+            try:
+                messages = usd.messages
+            except AttributeError:
+                pass
+            else:
+                for i, msg in enumerate(messages):
+                    if msg is message:
+                        del messages[i]
+                        break
+        if message.decoration:
+            self.editor.decorations.remove(message.decoration)
 
     def remove_message(self, message):
         """
@@ -258,49 +361,101 @@ class CheckerMode(Mode, QtCore.QObject):
 
         :param message: Message to remove
         """
-        import time
         _logger(self.__class__).log(5, 'removing message %s' % message)
-        t = time.time()
-        usd = message.block.userData()
-        if usd:
-            try:
-                usd.messages.remove(message)
-            except (AttributeError, ValueError):
-                pass
-        if message.decoration:
-            self.editor.decorations.remove(message.decoration)
+        self._discard_message(message)
         self._messages.remove(message)
 
     def clear_messages(self):
         """
         Clears all messages.
         """
-        while len(self._messages):
-            msg = self._messages.pop(0)
-            usd = msg.block.userData()
-            if usd and hasattr(usd, 'messages'):
-                usd.messages[:] = []
-            if msg.decoration:
-                self.editor.decorations.remove(msg.decoration)
+        with self.editor.decorations.batch():
+            for msg in self._messages:
+                usd = msg.block.userData()
+                if usd and hasattr(usd, 'messages'):
+                    usd.messages[:] = []
+                if msg.decoration:
+                    self.editor.decorations.remove(msg.decoration)
+            self._messages = []
 
     def on_state_changed(self, state):
         if state:
             self.editor.textChanged.connect(self.request_analysis)
             self.editor.new_text_set.connect(self.clear_messages)
+            self._connect_document()
             self.request_analysis()
         else:
             self.editor.textChanged.disconnect(self.request_analysis)
             self.editor.new_text_set.disconnect(self.clear_messages)
+            self._disconnect_document()
             self._job_runner.cancel_requests()
             self.clear_messages()
+            self._dirty = None
+
+    def clone_settings(self, original):
+        self.incremental = original.incremental
+        if self.enabled:
+            # the clone now shares the document of the original editor
+            self._connect_document()
+
+    def _connect_document(self):
+        # the editor document might be replaced (see CodeEdit.link), keep the
+        # one we are connected to
+        self._disconnect_document()
+        self._dirty = None
+        self._document = self.editor.document()
+        self._document.contentsChange.connect(self._on_contents_change)
+
+    def _disconnect_document(self):
+        if self._document is None:
+            return
+        try:
+            self._document.contentsChange.disconnect(
+                self._on_contents_change)
+        except (RuntimeError, TypeError):
+            # document has been deleted
+            pass
+        self._document = None
+
+    def _on_contents_change(self, position, chars_removed, chars_added):
+        if not self.incremental:
+            return
+        end = position + chars_added
+        if self._dirty is None:
+            start_cursor = QtGui.QTextCursor(self.editor.document())
+            start_cursor.setPosition(position)
+            end_cursor = QtGui.QTextCursor(self.editor.document())
+            end_cursor.setPosition(end)
+            self._dirty = start_cursor, end_cursor
+        else:
+            start_cursor, end_cursor = self._dirty
+            if position < start_cursor.position():
+                start_cursor.setPosition(position)
+            if end > end_cursor.position():
+                end_cursor.setPosition(end)
+
+    def _dirty_region(self):
+        """
+        Returns the lines edited since the previous request ([first, last]),
+        or None if nothing has been edited.
+        """
+        if self._dirty is None:
+            return None
+        start_cursor, end_cursor = self._dirty
+        return [start_cursor.blockNumber(), end_cursor.blockNumber()]
 
     def _on_work_finished(self, results):
         """
         Display results.
 
         :param status: Response status
-        :param results: Response data, messages.
+        :param results: Response data, messages (or a dict with the region
+            that has been checked and its messages).
         """
+        region = None
+        if isinstance(results, dict):
+            region = results['region']
+            results = results['messages']
         messages = []
         for msg in results:
             msg = CheckerMessage(*msg)
@@ -309,7 +464,10 @@ class CheckerMode(Mode, QtCore.QObject):
             block = self.editor.document().findBlockByNumber(msg.line)
             msg.block = block
             messages.append(msg)
-        self.add_messages(messages)
+        if region is not None:
+            self._merge_messages(region, messages)
+        else:
+            self.add_messages(messages)
 
     def request_analysis(self):
         """
@@ -327,7 +485,7 @@ class CheckerMode(Mode, QtCore.QObject):
     def _request(self):
         """ Requests a checking of the editor content. """
         try:
-            self.editor.toPlainText()
+            code = self.editor.toPlainText()
         except (TypeError, RuntimeError):
             return
         try:
@@ -336,16 +494,20 @@ class CheckerMode(Mode, QtCore.QObject):
         except KeyError:
             max_line_length = 79
         request_data = {
-            'code': self.editor.toPlainText(),
+            'code': code,
             'path': self.editor.file.path,
             'encoding': self.editor.file.encoding,
             'ignore_rules': self.ignore_rules,
             'max_line_length': max_line_length,
         }
+        region = self._dirty_region() if self.incremental else None
+        if region is not None:
+            request_data['region'] = region
         try:
             self.editor.backend.send_request(
                 self._worker, request_data, on_receive=self._on_work_finished)
             self._finished = False
+            self._dirty = None
         except NotRunning:
             # retry later
             QtCore.QTimer.singleShot(100, self._request)
@@ -3,7 +3,6 @@
 This module contains the code completion mode and the related classes.
 """
 import logging
-import re
 import sys
 import time
 from pyqode.core.api.mode import Mode
@@ -26,68 +25,144 @@ def debug(msg, *args):
 
 
 
-class SubsequenceSortFilterProxyModel(QtCore.QSortFilterProxyModel):
+class SubsequenceMatcher(object):
     """
-    Performs subsequence matching/sorting (see pyQode/pyQode#1).
+    Performs subsequence matching/ranking (see pyQode/pyQode#1).
+
+    A candidate matches the prefix if it contains the prefix, or if it
+    contains a head of the prefix followed by the rest of the prefix
+    (e.g. ``settip`` matches ``setStatusTip``). Candidates are ranked by the
+    position of the match, longer heads and matching case being favoured.
+
+    Lower case keys are computed once per candidate list and, as long as the
+    user keeps typing, the candidates are narrowed down from the previous
+    matches instead of being all matched again.
     """
-    def __init__(self, case, parent=None):
-        QtCore.QSortFilterProxyModel.__init__(self, parent)
-        self.case = case
-
-    def set_prefix(self, prefix):
-        self.filter_patterns = []
-        self.filter_patterns_case_sensitive = []
-        self.sort_patterns = []
-        if self.case == QtCore.Qt.CaseInsensitive:
-            flags = re.IGNORECASE
+    def __init__(self):
+        self._names = []
+        self._keys = []
+        self._prefix = None
+        self._case_sensitive = False
+        self._matches = []
+
+    def set_candidates(self, names):
+        """
+        Sets the list of candidates to match.
+
+        :param names: list of completion names
+        """
+        self._names = list(names)
+        self._keys = [name.lower() for name in self._names]
+        self._prefix = None
+        self._matches = []
+
+    def match(self, prefix, case_sensitive=False):
+        """
+        Matches the candidates against ``prefix``.
+
+        :param prefix: completion prefix
+        :param case_sensitive: True to perform case sensitive matching.
+        :returns: the list of matching candidate indices, best match first.
+        """
+        if not prefix:
+            indices = list(range(len(self._names)))
+            self._prefix = None
+            return indices
+        if (self._prefix and case_sensitive == self._case_sensitive and
+                prefix.startswith(self._prefix)):
+            # the user typed more characters, only previous matches can
+            # still match
+            candidates = self._matches
         else:
-            flags = 0
-        for i in reversed(range(1, len(prefix) + 1)):
-            ptrn = '.*%s.*%s' % (prefix[0:i], prefix[i:])
-            try:
-                self.filter_patterns.append(re.compile(ptrn, flags))
-                self.filter_patterns_case_sensitive.append(re.compile(ptrn, 0))
-                ptrn = '%s.*%s' % (prefix[0:i], prefix[i:])
-                self.sort_patterns.append(re.compile(ptrn, flags))
-            except Exception:
-                continue
-        self.prefix = prefix
-
-    def filterAcceptsRow(self, row, _):
-        completion = self.sourceModel().data(self.sourceModel().index(row, 0))
-        if len(completion) < len(self.prefix):
-            return False
-        if len(self.prefix) == 1:
-            try:
-                prefix = self.prefix
-                if self.case == QtCore.Qt.CaseInsensitive:
-                    completion = completion.lower()
-                    prefix = self.prefix.lower()
-                rank = completion.index(prefix)
-                self.sourceModel().setData(
-                    self.sourceModel().index(row, 0), rank, QtCore.Qt.UserRole)
-                return prefix in completion
-            except ValueError:
-                return False
-        for i, patterns in enumerate(zip(self.filter_patterns,
-                                         self.filter_patterns_case_sensitive,
-                                         self.sort_patterns)):
-            pattern, pattern_case, sort_pattern = patterns
-            match = re.match(pattern, completion)
-            if match:
-                # compute rank, the lowest rank the closer it is from the
-                # completion
-                start = sys.maxsize
-                for m in sort_pattern.finditer(completion):
-                    start, end = m.span()
-                rank = start + i * 10
-                if re.match(pattern_case, completion):
+            candidates = range(len(self._names))
+        if case_sensitive:
+            needle = prefix
+            keys = self._names
+        else:
+            needle = prefix.lower()
+            keys = self._keys
+        ranked = []
+        if len(needle) == 1:
+            for i in candidates:
+                start = keys[i].find(needle)
+                if start != -1:
+                    ranked.append((start, i))
+        else:
+            names = self._names
+            for i in candidates:
+                rank = self._rank(needle, prefix, keys[i], names[i])
+                if rank is not None:
+                    ranked.append((rank, i))
+        ranked.sort()
+        self._matches = [i for _, i in ranked]
+        self._prefix = prefix
+        self._case_sensitive = case_sensitive
+        return list(self._matches)
+
+    @staticmethod
+    def _split_match(text, head, tail):
+        start = text.find(head)
+        if start == -1 or (tail and text.find(tail, start + len(head)) == -1):
+            return -1
+        return start
+
+    @classmethod
+    def _rank(cls, needle, prefix, key, name):
+        """
+        Returns the rank of a candidate (the lowest, the better) or None if
+        the candidate does not match.
+        """
+        if len(key) < len(needle):
+            return None
+        for i in range(len(needle), 0, -1):
+            start = cls._split_match(key, needle[:i], needle[i:])
+            if start != -1:
+                rank = start + (len(needle) - i) * 10
+                if cls._split_match(name, prefix[:i], prefix[i:]) != -1:
                     # favorise completions where case is matched
                     rank -= 10
-                self.sourceModel().setData(
-                    self.sourceModel().index(row, 0), rank, QtCore.Qt.UserRole)
-                return True
-        return len(self.prefix) == 0
+                return rank
+        return None
+
+
+class SubsequenceListModel(QtCore.QAbstractListModel):
+    """
+    Lightweight list model that exposes the rows of a source model which
+    match the completion prefix, in the order given by
+    :class:`SubsequenceMatcher`.
+    """
+    def __init__(self, parent=None):
+        super(SubsequenceListModel, self).__init__(parent)
+        self._source = None
+        self._rows = []
+
+    def set_source_model(self, model):
+        self.beginResetModel()
+        self._source = model
+        self._rows = []
+        self.endResetModel()
+
+    def set_rows(self, rows):
+        """
+        Sets the source rows to expose.
+
+        :param rows: list of source model row numbers.
+        """
+        if rows != self._rows:
+            self.beginResetModel()
+            self._rows = rows
+            self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or self._source is None:
+            return None
+        return self._source.data(
+            self._source.index(self._rows[index.row()], 0), role)
 
 
 class SubsequenceCompleter(QtWidgets.QCompleter):
@@ -98,32 +173,24 @@ class SubsequenceCompleter(QtWidgets.QCompleter):
         super(SubsequenceCompleter, self).__init__(*args)
         self.local_completion_prefix = ""
         self.source_model = None
-        self.filterProxyModel = SubsequenceSortFilterProxyModel(
-            self.caseSensitivity(), parent=self)
-        self.filterProxyModel.setSortRole(QtCore.Qt.UserRole)
-        self._force_next_update = True
+        self.matcher = SubsequenceMatcher()
+        self.filter_model = SubsequenceListModel(parent=self)
+        # the filter model is set once and for all, QCompleter deletes the
+        # models it owns when a new model is set.
+        super(SubsequenceCompleter, self).setModel(self.filter_model)
 
     def setModel(self, model):
         self.source_model = model
-        self.filterProxyModel = SubsequenceSortFilterProxyModel(
-            self.caseSensitivity(), parent=self)
-        self.filterProxyModel.setSortRole(QtCore.Qt.UserRole)
-        self.filterProxyModel.set_prefix(self.local_completion_prefix)
-        self.filterProxyModel.setSourceModel(self.source_model)
-        super(SubsequenceCompleter, self).setModel(self.filterProxyModel)
-        self.filterProxyModel.invalidate()
-        self.filterProxyModel.sort(0)
-        self._force_next_update = True
+        self.matcher.set_candidates(
+            [model.data(model.index(row, 0))
+             for row in range(model.rowCount())])
+        self.filter_model.set_source_model(model)
+        self.update_model()
 
     def update_model(self):
-        if (self.completionCount() or
-                len(self.local_completion_prefix) <= 1 or
-                self._force_next_update):
-            self.filterProxyModel.set_prefix(self.local_completion_prefix)
-            self.filterProxyModel.invalidate()  # force sorting/filtering
-        if self.completionCount() > 1:
-            self.filterProxyModel.sort(0)
-        self._force_next_update = False
+        self.filter_model.set_rows(self.matcher.match(
+            self.local_completion_prefix,
+            self.caseSensitivity() == QtCore.Qt.CaseSensitive))
 
     def splitPath(self, path):
         self.local_completion_prefix = path
@@ -157,6 +224,10 @@ class CodeCompletionMode(Mode, QtCore.QObject):
     #: powerful filter mode but also the SLOWEST.
     FILTER_FUZZY = 2
 
+    #: Completion icons, shared by all instances and indexed by their
+    #: specification (file name or (theme name, fallback file name)).
+    _icons = {}
+
     @property
     def filter_mode(self):
         """
@@ -292,6 +363,16 @@ class CodeCompletionMode(Mode, QtCore.QObject):
         self._tooltips = {}
         self._show_tooltips = False
         self._request_id = self._last_request_id = 0
+        #: Completion results and the prefix they have been requested for,
+        #: indexed by (document version, line, column)
+        self._cache = {}
+        self._document_version = 0
+        self._completion_span = None
+        self._request_key = None
+        self._request_prefix = ''
+        self._model = QtGui.QStandardItemModel()
+        self._model_key = None
+        self._popup_width = (None, '', 0)
 
     def clone_settings(self, original):
         self.trigger_key = original.trigger_key
@@ -315,6 +396,9 @@ class CodeCompletionMode(Mode, QtCore.QObject):
         else:
             self._completer = SubsequenceCompleter(self.editor)
         self._completer.setCompletionMode(self._completer.PopupCompletion)
+        # all completions have the same height, this saves a layout pass over
+        # every item each time the popup is shown
+        self._completer.popup().setUniformItemSizes(True)
         if self.case_sensitive:
             self._completer.setCaseSensitivity(QtCore.Qt.CaseSensitive)
         else:
@@ -326,7 +410,7 @@ class CodeCompletionMode(Mode, QtCore.QObject):
 
     def on_install(self, editor):
         self._create_completer()
-        self._completer.setModel(QtGui.QStandardItemModel())
+        self._completer.setModel(self._model)
         self._helper = TextHelper(editor)
         Mode.on_install(self, editor)
 
@@ -340,10 +424,19 @@ class CodeCompletionMode(Mode, QtCore.QObject):
             self.editor.focused_in.connect(self._on_focus_in)
             self.editor.key_pressed.connect(self._on_key_pressed)
             self.editor.post_key_pressed.connect(self._on_key_released)
+            self.editor.document().contentsChange.connect(
+                self._on_contents_change)
         else:
             self.editor.focused_in.disconnect(self._on_focus_in)
             self.editor.key_pressed.disconnect(self._on_key_pressed)
             self.editor.post_key_pressed.disconnect(self._on_key_released)
+            try:
+                self.editor.document().contentsChange.disconnect(
+                    self._on_contents_change)
+            except (RuntimeError, TypeError):
+                # document has been replaced
+                pass
+            self._clear_cache()
 
     #
     # Slots
@@ -433,6 +526,23 @@ class CodeCompletionMode(Mode, QtCore.QObject):
         """
         self._completer.setWidget(self.editor)
 
+    def _on_contents_change(self, position, chars_removed, chars_added):
+        """
+        Bumps the document version (and thus invalidates the completion
+        cache) unless the change only affects the word being completed.
+        """
+        span = self._completion_span
+        if span and span[0] <= position <= span[1] and \
+                position + chars_removed <= span[1]:
+            span[1] += chars_added - chars_removed
+        else:
+            self._clear_cache()
+
+    def _clear_cache(self):
+        self._document_version += 1
+        self._cache.clear()
+        self._completion_span = None
+
     def _on_selected_completion_changed(self, completion):
         self._current_completion = completion
 
@@ -446,8 +556,10 @@ class CodeCompletionMode(Mode, QtCore.QObject):
                         results, self.completion_prefix)
         context = results[0]
         results = results[1:]
-        line, column, request_id = context
+        line, column, request_id = context[:3]
         debug('request context: %r', context)
+        if len(context) > 3:
+            debug('provider timings: %r', context[3])
         debug('latest context: %r', (self._last_cursor_line,
                                                self._last_cursor_column,
                                                self._request_id))
@@ -458,7 +570,15 @@ class CodeCompletionMode(Mode, QtCore.QObject):
                 all_results = []
                 for res in results:
                     all_results += res
-                self._show_completions(all_results)
+                key = self._request_key
+                if key == (self._document_version, line, column):
+                    prefix = self._request_prefix
+                    self._cache[key] = (prefix, all_results)
+                    key += (prefix, )
+                else:
+                    # the document changed in the meantime
+                    key = None
+                self._show_completions(all_results, key)
         else:
             debug('outdated request, dropping')
 
@@ -491,6 +611,24 @@ class CodeCompletionMode(Mode, QtCore.QObject):
                 # same context but result not yet available
                 pass
             return True
+        key = (self._document_version, line, column)
+        position = self.editor.textCursor().position()
+        self._completion_span = [position - len(self.completion_prefix),
+                                 position]
+        prefix = self.completion_prefix
+        try:
+            cached_prefix, completions = self._cache[key]
+        except KeyError:
+            cached_prefix = completions = None
+        # providers filter their results with the prefix, the results of a
+        # longer prefix may miss some completions
+        if completions is not None and prefix.startswith(cached_prefix):
+            debug('completion cache hit: %r', key)
+            self._last_cursor_column = column
+            self._last_cursor_line = line
+            self._last_request_id = self._request_id - 1
+            self._show_completions(completions, key + (cached_prefix, ))
+            return True
         else:
             debug('requesting completion')
             data = {
@@ -499,7 +637,7 @@ class CodeCompletionMode(Mode, QtCore.QObject):
                 'column': column,
                 'path': self.editor.file.path,
                 'encoding': self.editor.file.encoding,
-                'prefix': self.completion_prefix,
+                'prefix': prefix,
                 'request_id': self._request_id
             }
             try:
@@ -511,6 +649,8 @@ class CodeCompletionMode(Mode, QtCore.QObject):
                 return False
             else:
                 debug('request sent: %r', data)
+                self._request_key = key
+                self._request_prefix = prefix
                 self._last_cursor_column = column
                 self._last_cursor_line = line
                 self._request_id += 1
@@ -550,12 +690,25 @@ class CodeCompletionMode(Mode, QtCore.QObject):
         cursor_rec.translate(
             self.editor.panels.margin_size() - prefix_len,
             self.editor.panels.margin_size(0) + 5)
-        popup = self._completer.popup()
-        width = popup.verticalScrollBar().sizeHint().width()
-        cursor_rec.setWidth(
-            self._completer.popup().sizeHintForColumn(0) + width)
+        cursor_rec.setWidth(self._get_popup_width())
         return cursor_rec
 
+    def _get_popup_width(self):
+        """
+        Computes the popup width. Typing more characters can only remove
+        completions from the popup so the width computed for the cached
+        completions is reused until the prefix gets shorter.
+        """
+        prefix = self.completion_prefix
+        key, cached_prefix, width = self._popup_width
+        if (key is None or key != self._model_key or
+                not prefix.startswith(cached_prefix)):
+            popup = self._completer.popup()
+            width = (popup.sizeHintForColumn(0) +
+                     popup.verticalScrollBar().sizeHint().width())
+            self._popup_width = (self._model_key, prefix, width)
+        return width
+
     def _show_popup(self, index=0):
         """
         Shows the popup at the specified index.
@@ -589,25 +742,55 @@ class CodeCompletionMode(Mode, QtCore.QObject):
             else:
                 debug('cannot show popup, editor is not visible')
 
-    def _show_completions(self, completions):
+    def _show_completions(self, completions, key=None):
+        """
+        Shows the completion popup.
+
+        :param completions: list of completions
+        :param key: cache key and prefix of the completions, the model is
+            not rebuilt if it already holds the completions for this key.
+        """
         debug("showing %d completions" % len(completions))
         debug('popup state: %r', self._completer.popup().isVisible())
         t = time.time()
-        self._update_model(completions)
+        if key is None or key != self._model_key:
+            self._update_model(completions)
+            self._model_key = key
         elapsed = time.time() - t
         debug("completion model updated: %d items in %f seconds",
                         self._completer.model().rowCount(), elapsed)
         self._show_popup()
 
+    @classmethod
+    def _icon(cls, spec):
+        """
+        Returns the icon that matches an icon specification, icons are
+        created only once.
+
+        :param spec: icon file name or (theme name, fallback file name)
+        """
+        if isinstance(spec, list):
+            spec = tuple(spec)
+        try:
+            return cls._icons[spec]
+        except KeyError:
+            if isinstance(spec, tuple):
+                icon = QtGui.QIcon.fromTheme(spec[0], QtGui.QIcon(spec[1]))
+            else:
+                icon = QtGui.QIcon(spec)
+            cls._icons[spec] = icon
+            return icon
+
     def _update_model(self, completions):
         """
-        Creates a QStandardModel that holds the suggestion from the completion
+        Fills the QStandardModel that holds the suggestion from the completion
         models for the QCompleter
 
-        :param completionPrefix:
+        :param completions: list of completions
         """
-        # build the completion model
-        cc_model = QtGui.QStandardItemModel()
+        # fill the completion model
+        cc_model = self._model
+        cc_model.clear()
         self._tooltips.clear()
         for completion in completions:
             name = completion['name']
@@ -616,12 +799,7 @@ class CodeCompletionMode(Mode, QtCore.QObject):
             if 'tooltip' in completion and completion['tooltip']:
                 self._tooltips[name] = completion['tooltip']
             if 'icon' in completion:
-                icon = completion['icon']
-                if isinstance(icon, list):
-                    icon = QtGui.QIcon.fromTheme(icon[0], QtGui.QIcon(icon[1]))
-                else:
-                    icon = QtGui.QIcon(icon)
-                item.setData(QtGui.QIcon(icon),
+                item.setData(self._icon(completion['icon']),
                              QtCore.Qt.DecorationRole)
             cc_model.appendRow(item)
         try:
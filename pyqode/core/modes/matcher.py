@@ -120,8 +120,9 @@ class SymbolMatcherMode(Mode):
         self._unmatch_foreground = QtGui.QColor('red')
 
     def _clear_decorations(self):
-        for deco in self._decorations:
-            self.editor.decorations.remove(deco)
+        with self.editor.decorations.batch():
+            for deco in self._decorations:
+                self.editor.decorations.remove(deco)
         self._decorations[:] = []
 
     def symbol_pos(self, cursor, character_type=OPEN, symbol_type=PAREN):
@@ -150,14 +151,14 @@ class SymbolMatcherMode(Mode):
 
     def _refresh_decorations(self):
         for deco in self._decorations:
-            self.editor.decorations.remove(deco)
             if deco.match:
                 deco.set_foreground(self._match_foreground)
                 deco.set_background(self._match_background)
             else:
                 deco.set_foreground(self._unmatch_foreground)
                 deco.set_background(self._unmatch_background)
-            self.editor.decorations.append(deco)
+        if self._decorations:
+            self.editor.decorations.refresh()
 
     def on_state_changed(self, state):
         if state:
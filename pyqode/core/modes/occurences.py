@@ -119,8 +119,9 @@ class OccurrencesHighlighterMode(Mode):
             self.timer.cancel_requests()
 
     def _clear_decos(self):
-        for d in self._decorations:
-            self.editor.decorations.remove(d)
+        with self.editor.decorations.batch():
+            for d in self._decorations:
+                self.editor.decorations.remove(d)
         self._decorations[:] = []
 
     def _request_highlight(self):
@@ -139,16 +140,18 @@ class OccurrencesHighlighterMode(Mode):
         self._sub = TextHelper(self.editor).word_under_cursor(
             select_whole_word=True).selectedText()
         if not cursor.hasSelection() or cursor.selectedText() == self._sub:
+            text = self.editor.toPlainText()
             request_data = {
-                'string': self.editor.toPlainText(),
+                'string': text,
                 'sub': self._sub,
                 'regex': False,
                 'whole_word': True,
                 'case_sensitive': self.case_sensitive
             }
             try:
-                self.editor.backend.send_request(findall, request_data,
-                                                 self._on_results_available)
+                self.editor.backend.send_adaptive_request(
+                    findall, request_data, len(text),
+                    self._on_results_available)
             except NotRunning:
                 self._request_highlight()
 
@@ -161,20 +164,21 @@ class OccurrencesHighlighterMode(Mode):
             results = results[:500]
         current = self.editor.textCursor().position()
         if len(results) > 1:
-            for start, end in results:
-                if start <= current <= end:
-                    continue
-                deco = TextDecoration(self.editor.textCursor(),
-                                      start_pos=start, end_pos=end)
-                if self.underlined:
-                    deco.set_as_underlined(self._background)
-                else:
-                    deco.set_background(QtGui.QBrush(self._background))
-                    if self._foreground is not None:
-                        deco.set_foreground(self._foreground)
-                deco.draw_order = 3
-                self.editor.decorations.append(deco)
-                self._decorations.append(deco)
+            with self.editor.decorations.batch():
+                for start, end in results:
+                    if start <= current <= end:
+                        continue
+                    deco = TextDecoration(self.editor.textCursor(),
+                                          start_pos=start, end_pos=end)
+                    if self.underlined:
+                        deco.set_as_underlined(self._background)
+                    else:
+                        deco.set_background(QtGui.QBrush(self._background))
+                        if self._foreground is not None:
+                            deco.set_foreground(self._foreground)
+                    deco.draw_order = 3
+                    self.editor.decorations.append(deco)
+                    self._decorations.append(deco)
 
     def clone_settings(self, original):
         self.delay = original.delay
@@ -5,25 +5,34 @@ on pygments.
 
 .. note: This code is taken and adapted from the IPython project.
 """
+import fnmatch
 import logging
 import mimetypes
+import os
+import re
 import sys
+import threading
 
 from pygments.formatters.html import HtmlFormatter
 from pygments.lexer import Error, RegexLexer, Text, _TokenType
 from pygments.lexers import get_lexer_for_filename, get_lexer_for_mimetype
-from pygments.lexers.agile import PythonLexer
-from pygments.lexers.compiled import CLexer, CppLexer
+try:
+    from pygments.lexers.python import PythonLexer
+    from pygments.lexers.c_cpp import CLexer, CppLexer
+except ImportError:
+    # pygments < 2.0
+    from pygments.lexers.agile import PythonLexer
+    from pygments.lexers.compiled import CLexer, CppLexer
 from pygments.lexers.dotnet import CSharpLexer
 from pygments.lexers.special import TextLexer
-from pygments.styles import get_style_by_name, get_all_styles
 from pygments.token import Whitespace, Comment, Token
 from pygments.util import ClassNotFound
 from pyqode.qt import QtGui
-from pyqode.qt.QtCore import QRegExp
 
 from pyqode.core.api.syntax_highlighter import (
-    SyntaxHighlighter, ColorScheme, TextBlockUserData)
+    SyntaxHighlighter, ColorScheme, TextBlockUserData, _PygmentsStyles,
+    _get_style_by_name)
+from pyqode.core.api.utils import TextBlockHelper
 
 
 def _logger():
@@ -31,11 +40,109 @@ def _logger():
     return logging.getLogger(__name__)
 
 
+#: Splits token values on white spaces, which are highlighted with the editor
+#: white spaces foreground
+_WHITESPACES = re.compile(r'(\s+)')
+
+#: Tokens whose formats are flagged as user objects (see
+#: :meth:`PygmentsSH._get_format`)
+_USER_OBJECT_TOKENS = frozenset([
+    Token.Literal.String, Token.Literal.String.Doc, Token.Comment])
+
 #: A sorted list of available pygments styles, for convenience
-PYGMENTS_STYLES = sorted(list(get_all_styles()))
+PYGMENTS_STYLES = _PygmentsStyles(
+    ['darcula', 'qt'] if hasattr(sys, 'frozen') else [])
+
+
+#: Token formats of each pygments style, shared by all the highlighters.
+_STYLE_FORMATS = {}
+
+#: Brushes of the pygments colors, shared by all the highlighters.
+_BRUSHES = {}
 
-if hasattr(sys, 'frozen'):
-    PYGMENTS_STYLES += ['darcula', 'qt']
+#: Lexer classes found by :func:`_get_lexer_for_filename` and
+#: :func:`_get_lexer_for_mimetype` (None if no lexer were found).
+_LEXER_CLASSES = {}
+
+#: The file name patterns of all the pygments lexers, see
+#: :func:`_filename_key`.
+_FILENAME_PATTERNS = None
+
+
+def _get_filename_patterns():
+    """
+    Gets the file name patterns of the pygments lexers: the set of extensions
+    (from the "*.ext" patterns) and the list of the other patterns.
+    """
+    global _FILENAME_PATTERNS
+    if _FILENAME_PATTERNS is None:
+        from pygments.lexers._mapping import LEXERS
+        from pygments.plugin import find_plugin_lexers
+        patterns = set()
+        for lexer_info in LEXERS.values():
+            patterns.update(lexer_info[3])
+        for lexer in find_plugin_lexers():
+            patterns.update(lexer.filenames)
+        extensions = set()
+        others = []
+        for pattern in patterns:
+            pattern = os.path.normcase(pattern)
+            if (pattern.startswith('*.') and
+                    not any(c in pattern[1:] for c in '*?[')):
+                extensions.add(pattern[1:])
+            else:
+                others.append(pattern)
+        _FILENAME_PATTERNS = extensions, others
+    return _FILENAME_PATTERNS
+
+
+def _filename_key(filename):
+    """
+    Gets a key that identifies the pygments file name patterns that match
+    ``filename``: files with the same key get the same lexer.
+    """
+    extensions, others = _get_filename_patterns()
+    name = os.path.normcase(os.path.basename(filename))
+    return (tuple(name[i:] for i, c in enumerate(name)
+                  if c == '.' and name[i:] in extensions),
+            tuple(p for p in others if fnmatch.fnmatch(name, p)))
+
+
+def _get_lexer_for_filename(filename, **options):
+    """
+    Cached version of ``pygments.lexers.get_lexer_for_filename``, which scans
+    the file name patterns of all the lexers and plugins on every call.
+    """
+    key = ('filename', _filename_key(filename))
+    try:
+        lexer_class = _LEXER_CLASSES[key]
+    except KeyError:
+        try:
+            lexer_class = get_lexer_for_filename(filename).__class__
+        except ClassNotFound:
+            lexer_class = None
+        _LEXER_CLASSES[key] = lexer_class
+    if lexer_class is None:
+        raise ClassNotFound('no lexer for filename %r found' % filename)
+    return lexer_class(**options)
+
+
+def _get_lexer_for_mimetype(mime, **options):
+    """
+    Cached version of ``pygments.lexers.get_lexer_for_mimetype``.
+    """
+    key = ('mimetype', mime)
+    try:
+        lexer_class = _LEXER_CLASSES[key]
+    except KeyError:
+        try:
+            lexer_class = get_lexer_for_mimetype(mime).__class__
+        except ClassNotFound:
+            lexer_class = None
+        _LEXER_CLASSES[key] = lexer_class
+    if lexer_class is None:
+        raise ClassNotFound('no lexer for mimetype %r found' % mime)
+    return lexer_class(**options)
 
 
 def get_tokens_unprocessed(self, text, stack=('root',)):
@@ -114,6 +221,52 @@ def replace_pattern(tokens, new_pattern):
             if isinstance(pattern, tuple) and pattern[1] == new_pattern[1]:
                 state[index] = new_pattern
 
+def _lex(lexer, text, stack):
+    """
+    Lexes a line of text, starting from the given lexer state.
+
+    :param lexer: pygments lexer to use. Lexers store their state on
+        themselves, they must not be shared between threads.
+    :param text: text to lex
+    :param stack: the state stack of the lexer at the start of the text (None
+        to start from the root state, which is also used if the stack has
+        states that the lexer does not know)
+    :return: the token runs, as a flat (length, token, length, token, ...)
+        tuple, and the state stack at the end of the text (a tuple, None if
+        the lexer does not save it). White spaces are split into their own
+        ``Whitespace`` runs and adjacent runs of the same token are merged.
+    """
+    tokendefs = getattr(lexer, '_tokens', None)
+    if stack is not None and tokendefs is not None:
+        for state in stack:
+            if state not in tokendefs:
+                stack = None
+                break
+    if stack is None:
+        lexer.__dict__.pop('_saved_state_stack', None)
+    else:
+        lexer._saved_state_stack = stack
+    runs = []
+    for token, value in lexer.get_tokens(text):
+        if token is not Whitespace and _WHITESPACES.search(value):
+            parts = _WHITESPACES.split(value)
+        else:
+            parts = [value]
+        for part in parts:
+            if not part:
+                continue
+            part_token = Whitespace if part.isspace() else token
+            if runs and runs[-1] is part_token:
+                runs[-2] += len(part)
+            else:
+                runs.append(len(part))
+                runs.append(part_token)
+    stack = lexer.__dict__.pop('_saved_state_stack', None)
+    if stack is not None:
+        stack = tuple(stack)
+    return tuple(runs), stack
+
+
 # More monkeypatching!
 COMMENT_START = (r'/\*', Comment.Multiline, 'comment')
 COMMENT_STATE = [(r'[^*/]', Comment.Multiline),
@@ -137,13 +290,18 @@ class PygmentsSH(SyntaxHighlighter):
     namespace packages to see what other languages are available (at the time
     of writing, only python has specialised support).
 
-    .. warning:: There are some issues with multi-line comments, they are not
-                 properly highlighted until a full re-highlight is triggered.
-                 The text is automatically re-highlighted on save.
+    The lexer state at the end of each block is stored in the block user
+    state, editing a block re-highlights the following blocks until the lexer
+    state converges.
     """
     #: Mode description
     DESCRIPTION = "Apply syntax highlighting to the editor using pygments"
 
+    #: Highest lexer state id (see :meth:`_state_id`), 0xFFFF is the state of
+    #: the blocks that have not been highlighted (see
+    #: :meth:`pyqode.core.api.TextBlockHelper.get_state`).
+    MAX_STATE_ID = 0xFFFE
+
     @property
     def pygments_style(self):
         """
@@ -165,25 +323,35 @@ class PygmentsSH(SyntaxHighlighter):
         self._formatter = HtmlFormatter(nowrap=True)
         self._lexer = lexer if lexer else PythonLexer()
 
-        self._brushes = {}
+        self._brushes = _BRUSHES
         self._formats = {}
+        self._whitespace_format = None
         self._init_style()
-        self._prev_block = None
+        #: Token runs lexed in a background thread during a chunked
+        #: rehighlight, indexed by block number, see :meth:`_prefetch`.
+        self._prefetched = []
+        self._prefetch_id = 0
+        #: (Lexer, state stack) pairs interned into the ids stored in the
+        #: blocks user state, see :meth:`_state_id`.
+        self._state_ids = {}
+        self._state_stacks = [None]
 
     def _init_style(self):
         """ Init pygments style """
         self._update_style()
 
     def clone_settings(self, original):
-
+        super(PygmentsSH, self).clone_settings(original)
         # The lexer can be shared between clones.
         self._lexer = original._lexer
+        # The state ids are stored in the (shared) document.
+        self._state_ids = original._state_ids
+        self._state_stacks = original._state_stacks
 
     def on_install(self, editor):
         """
         :type editor: pyqode.code.api.CodeEdit
         """
-        self._clear_caches()
         self._update_style()
         super(PygmentsSH, self).on_install(editor)
 
@@ -225,14 +393,14 @@ class PygmentsSH(SyntaxHighlighter):
         if filename.endswith("~"):
             filename = filename[0:len(filename) - 1]
         try:
-            self._lexer = get_lexer_for_filename(filename)
+            self._lexer = _get_lexer_for_filename(filename)
         except (ClassNotFound, ImportError):
             print('class not found for url', filename)
             try:
                 m = mimetypes.guess_type(filename)
-                self._lexer = get_lexer_for_mimetype(m[0])
+                self._lexer = _get_lexer_for_mimetype(m[0])
             except (ClassNotFound, IndexError, ImportError):
-                self._lexer = get_lexer_for_mimetype('text/plain')
+                self._lexer = _get_lexer_for_mimetype('text/plain')
         if self._lexer is None:
             _logger().warning('failed to get lexer from filename: %s, using '
                               'plain text instead...', filename)
@@ -247,10 +415,10 @@ class PygmentsSH(SyntaxHighlighter):
         """
 
         try:
-            self._lexer = get_lexer_for_mimetype(mime, **options)
+            self._lexer = _get_lexer_for_mimetype(mime, **options)
         except (ClassNotFound, ImportError):
             print('class not found for mime', mime)
-            self._lexer = get_lexer_for_mimetype('text/plain')
+            self._lexer = _get_lexer_for_mimetype('text/plain')
         else:
             _logger().debug('lexer for mimetype (%s): %r', mime, self._lexer)
 
@@ -264,54 +432,167 @@ class PygmentsSH(SyntaxHighlighter):
         if self.color_scheme.name != self._pygments_style:
             self._pygments_style = self.color_scheme.name
             self._update_style()
-        original_text = text
         if self.editor and self._lexer and self.enabled:
+            state = 0
             if block.blockNumber():
-                prev_data = self._prev_block.userData()
-                if prev_data:
-                    if hasattr(prev_data, "syntax_stack"):
-                        self._lexer._saved_state_stack = prev_data.syntax_stack
-                    elif hasattr(self._lexer, '_saved_state_stack'):
-                        del self._lexer._saved_state_stack
-
-            # Lex the text using Pygments
-            index = 0
+                # blocks are not always highlighted in order (see
+                # SyntaxHighlighter.rehighlight)
+                state = max(0, TextBlockHelper.get_state(block.previous()))
             usd = block.userData()
             if usd is None:
                 usd = TextBlockUserData()
                 block.setUserData(usd)
-            tokens = list(self._lexer.get_tokens(text))
-            for token, text in tokens:
-                length = len(text)
-                fmt = self._get_format(token)
-                if token in [Token.Literal.String, Token.Literal.String.Doc,
-                             Token.Comment]:
-                    fmt.setObjectType(fmt.UserObject)
-                self.setFormat(index, length, fmt)
-                index += length
-
-            if hasattr(self._lexer, '_saved_state_stack'):
-                setattr(usd, "syntax_stack", self._lexer._saved_state_stack)
-                # Clean up for the next go-round.
-                del self._lexer._saved_state_stack
-
-            # spaces
-            text = original_text
-            expression = QRegExp(r'\s+')
-            index = expression.indexIn(text, 0)
-            while index >= 0:
-                index = expression.pos(0)
-                length = len(expression.cap(0))
-                self.setFormat(index, length, self._get_format(Whitespace))
-                index = expression.indexIn(text, index + length)
-
-            self._prev_block = block
+            runs, state = self._get_token_runs(
+                text, block.blockNumber(), state, usd)
+            TextBlockHelper.set_state(block, state)
+            self._apply_formats(runs)
+
+    def _apply_formats(self, runs):
+        """
+        Applies the formats of the token runs of a block.
+
+        Adjacent runs that have the same format are merged so that setFormat
+        is called as few times as possible.
+        """
+        formats = self._formats
+        ws_format = self._get_whitespace_format()
+        index = start = 0
+        current = None
+        for i in range(0, len(runs), 2):
+            token = runs[i + 1]
+            if token is Whitespace:
+                fmt = ws_format
+            else:
+                fmt = formats.get(token)
+                if fmt is None:
+                    fmt = self._get_format(token)
+            if fmt is not current:
+                if current is not None:
+                    self.setFormat(start, index - start, current)
+                start = index
+                current = fmt
+            index += runs[i]
+        if current is not None:
+            self.setFormat(start, index - start, current)
+
+    def _get_token_runs(self, text, block_nbr, state, usd):
+        """
+        Gets the token runs of a block and the lexer state id at the end of
+        the block.
+
+        The text is only lexed if neither the runs cached on the block user
+        data nor the prefetched runs match the block text and the lexer state
+        at the start of the block.
+        """
+        lexer = self._lexer
+        cached = usd.token_runs
+        if (cached is not None and cached[0] == text and
+                cached[1] == state and cached[2] is lexer):
+            return cached[3], cached[4]
+        try:
+            entry = self._prefetched[block_nbr]
+        except IndexError:
+            entry = None
+        if (entry is not None and entry[0] == text and entry[2] is lexer and
+                self._state_id(entry[1]) == state):
+            runs, end_stack = entry[3], entry[4]
+        else:
+            runs, end_stack = _lex(lexer, text, self._state_stack(state))
+        end_state = self._state_id(end_stack)
+        usd.token_runs = (text, state, lexer, runs, end_state)
+        return runs, end_state
+
+    def _state_id(self, stack):
+        """
+        Gets the id of a lexer state stack, 0 for the default state.
+
+        Storing this id in the block user state lets QSyntaxHighlighter
+        highlight the next blocks until the lexer state converges (e.g. after
+        a multi-line string has been opened or closed).
+
+        Stacks are interned per lexer: when the lexer changes, the ids that
+        the blocks still hold map to the default state of the new lexer.
+
+        The user state has 16 bits for the syntax highlighter: all the stacks
+        seen once the table is full share the last id (and are lexed from the
+        default state).
+        """
+        if stack is None:
+            return 0
+        key = (self._lexer, stack)
+        try:
+            return self._state_ids[key]
+        except KeyError:
+            state_id = len(self._state_stacks)
+            if state_id < self.MAX_STATE_ID:
+                self._state_ids[key] = state_id
+                self._state_stacks.append(key)
+                return state_id
+            return self.MAX_STATE_ID
+
+    def _state_stack(self, state_id):
+        """
+        Gets the lexer state stack that has the given id (see
+        :meth:`_state_id`).
+        """
+        try:
+            lexer, stack = self._state_stacks[state_id]
+        except (IndexError, TypeError):
+            return None
+        if lexer is not self._lexer:
+            return None
+        return stack
+
+    def _start_chunked_rehighlight(self, document):
+        self._prefetch(document)
+        super(PygmentsSH, self)._start_chunked_rehighlight(document)
+
+    def _stop_chunked_rehighlight(self):
+        super(PygmentsSH, self)._stop_chunked_rehighlight()
+        self._prefetch_id += 1
+        self._prefetched = []
+
+    def _prefetch(self, document):
+        """
+        Lexes a snapshot of the document in a background thread, ahead of
+        the chunked rehighlight that will apply the resulting token runs.
+
+        Results are checked against the actual block text and lexer state
+        when applied, so edits made in the meantime are harmless.
+        """
+        lexer = self._lexer
+        if getattr(document.lastBlock().userData(), 'token_runs', None):
+            # already highlighted (e.g. color scheme change), blocks will
+            # reuse their cached runs.
+            return
+        try:
+            thread_lexer = lexer.__class__(**lexer.options)
+        except Exception:
+            _logger().debug('cannot copy lexer %r, not prefetching', lexer)
+            return
+        lines = document.toPlainText().split('\n')
+        self._prefetch_id += 1
+        prefetch_id = self._prefetch_id
+        results = self._prefetched = []
+
+        def run():
+            stack = None
+            for text in lines:
+                if self._prefetch_id != prefetch_id:
+                    return
+                runs, end_stack = _lex(thread_lexer, text, stack)
+                results.append((text, stack, lexer, runs, end_stack))
+                stack = end_stack
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
 
     def _update_style(self):
         """ Sets the style to the specified Pygments style.
         """
         try:
-            self._style = get_style_by_name(self._pygments_style)
+            self._style = _get_style_by_name(self._pygments_style)
         except ClassNotFound:
             # unknown style, also happen with plugins style when used from a
             # frozen app.
@@ -322,18 +603,20 @@ class PygmentsSH(SyntaxHighlighter):
                 from pyqode.core.styles import DarculaStyle
                 self._style = DarculaStyle
             else:
-                self._style = get_style_by_name('default')
+                self._style = _get_style_by_name('default')
                 self._pygments_style = 'default'
-        self._clear_caches()
+        self._select_formats()
 
-    def _clear_caches(self):
-        """ Clear caches for brushes and formats.
+    def _select_formats(self):
+        """ Switches to the (shared) formats of the current style.
         """
-        self._brushes.clear()
-        self._formats.clear()
+        self._formats = _STYLE_FORMATS.setdefault(self._pygments_style, {})
+        self._whitespace_format = None
 
     def _get_format(self, token):
         """ Returns a QTextCharFormat for token or None.
+
+        Formats are computed once per style and per token type.
         """
         if token == Whitespace:
             return self.editor.whitespaces_foreground
@@ -342,14 +625,35 @@ class PygmentsSH(SyntaxHighlighter):
             return self._formats[token]
 
         result = self._get_format_from_style(token, self._style)
+        if token in _USER_OBJECT_TOKENS:
+            result.setObjectType(result.UserObject)
 
         self._formats[token] = result
         return result
 
+    def _get_whitespace_format(self):
+        """ Returns the format of white spaces, made of the editor white
+        spaces foreground.
+        """
+        color = self.editor.whitespaces_foreground
+        key = None if color is None else color.rgba()
+        if (self._whitespace_format is None or
+                self._whitespace_format[0] != key):
+            fmt = QtGui.QTextCharFormat()
+            if color is not None:
+                fmt.setForeground(color)
+            self._whitespace_format = (key, fmt)
+        return self._whitespace_format[1]
+
     def _get_format_from_style(self, token, style):
         """ Returns a QTextCharFormat for token by reading a Pygments style.
+
+        Token types unknown to the style use the style of their closest known
+        parent.
         """
         result = QtGui.QTextCharFormat()
+        while not style.styles_token(token) and token.parent is not None:
+            token = token.parent
         try:
             style = style.style_for_token(token)
         except KeyError:
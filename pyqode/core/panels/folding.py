@@ -7,7 +7,8 @@ import os
 import sys
 from pyqode.core.api import TextBlockHelper, folding, TextDecoration, \
     DelayJobRunner
-from pyqode.core.api.folding import FoldScope
+from pyqode.core.api.folding import FoldScope, _FoldIndex, \
+    _apply_fold_states
 from pyqode.core.api.panel import Panel
 from pyqode.qt import QtCore, QtWidgets, QtGui, PYQT5_API
 from pyqode.core.api.utils import TextHelper, drift_color, keep_tc_pos
@@ -162,8 +163,11 @@ class FoldingPanel(Panel):
         #: the list of deco used to highlight the current fold region (
         #: surrounding regions are darker)
         self._scope_decos = []
-        #: the list of folded blocs decorations
-        self._block_decos = []
+        #: the folded blocks decorations, indexed by trigger block number
+        self._block_decos = {}
+        #: True when the block numbers of the decorations have to be updated
+        #: (lines were inserted or removed)
+        self._block_decos_moved = False
         self.setMouseTracking(True)
         self.scrollable = True
         self._mouse_over_line = None
@@ -236,27 +240,12 @@ class FoldingPanel(Panel):
                 mouse_over = self._mouse_over_line == line_number
                 self._draw_fold_indicator(
                     top_position, mouse_over, collapsed, painter)
-                if collapsed:
-                    # check if the block already has a decoration, it might
-                    # have been folded by the parent editor/document in the
-                    # case of cloned editor
-                    for deco in self._block_decos:
-                        if deco.block == block:
-                            # no need to add a deco, just go to the next block
-                            break
-                    else:
-                        self._add_fold_decoration(block, FoldScope(block))
-                else:
-                    for deco in self._block_decos:
-                        # check if the block decoration has been removed, it
-                        # might have been unfolded by the parent
-                        # editor/document in the case of cloned editor
-                        if deco.block == block:
-                            # remove it and
-                            self._block_decos.remove(deco)
-                            self.editor.decorations.remove(deco)
-                            del deco
-                            break
+                # the block might have been (un)folded by the parent
+                # editor/document in the case of cloned editor or by
+                # collapse_all, the decoration is only (re)created if the state
+                # does not match
+                if collapsed != (self._get_fold_decoration(block) is not None):
+                    self._update_fold_decoration(block)
 
     def _draw_fold_region_background(self, block, painter):
         """
@@ -390,26 +379,16 @@ class FoldingPanel(Panel):
         Find parent scope, if the block is not a fold trigger.
 
         """
-        original = block
-        if not TextBlockHelper.is_fold_trigger(block):
-            # search level of next non blank line
-            while block.text().strip() == '' and block.isValid():
-                block = block.next()
-            ref_lvl = TextBlockHelper.get_fold_lvl(block) - 1
-            block = original
-            while (block.blockNumber() and
-                   (not TextBlockHelper.is_fold_trigger(block) or
-                    TextBlockHelper.get_fold_lvl(block) > ref_lvl)):
-                block = block.previous()
-        return block
+        return FoldScope.find_parent_scope(block)
 
     def _clear_scope_decos(self):
         """
         Clear scope decorations (on the editor)
 
         """
-        for deco in self._scope_decos:
-            self.editor.decorations.remove(deco)
+        with self.editor.decorations.batch():
+            for deco in self._scope_decos:
+                self.editor.decorations.remove(deco)
         self._scope_decos[:] = []
 
     def _get_scope_highlight_color(self):
@@ -506,11 +485,12 @@ class FoldingPanel(Panel):
         if (self._current_scope is None or
                 self._current_scope.get_range() != scope.get_range()):
             self._current_scope = scope
-            self._clear_scope_decos()
-            # highlight surrounding parent scopes with a darker color
-            start, end = scope.get_range()
-            if not TextBlockHelper.is_collapsed(block):
-                self._add_scope_decorations(block, start, end)
+            with self.editor.decorations.batch():
+                self._clear_scope_decos()
+                # highlight surrounding parent scopes with a darker color
+                start, end = scope.get_range()
+                if not TextBlockHelper.is_collapsed(block):
+                    self._add_scope_decorations(block, start, end)
 
     def mouseMoveEvent(self, event):
         """
@@ -584,9 +564,45 @@ class FoldingPanel(Panel):
             self._get_scope_highlight_color(), 110))
         deco.set_background(self._get_scope_highlight_color())
         deco.set_foreground(QtGui.QColor('#808080'))
-        self._block_decos.append(deco)
+        self._block_decos[block.blockNumber()] = deco
         self.editor.decorations.append(deco)
 
+    def _get_fold_decoration(self, block):
+        """
+        Returns the fold decoration of a trigger block, None if the block has
+        no decoration.
+        """
+        if self._block_decos_moved:
+            self._block_decos_moved = False
+            decos = {}
+            with self.editor.decorations.batch():
+                for deco in self._block_decos.values():
+                    nbr = deco.block.blockNumber()
+                    if nbr in decos or not TextBlockHelper.is_collapsed(
+                            deco.block):
+                        # the trigger block has been removed or expanded
+                        self.editor.decorations.remove(deco)
+                    else:
+                        decos[nbr] = deco
+            self._block_decos = decos
+        return self._block_decos.get(block.blockNumber())
+
+    def _update_fold_decoration(self, block):
+        """
+        Adds or removes the fold decoration of a trigger block depending on
+        its collapsed state.
+        """
+        deco = self._get_fold_decoration(block)
+        if TextBlockHelper.is_collapsed(block):
+            if deco is None:
+                self._add_fold_decoration(block, FoldScope(block))
+        elif deco is not None:
+            del self._block_decos[block.blockNumber()]
+            self.editor.decorations.remove(deco)
+
+    def _on_block_count_changed(self):
+        self._block_decos_moved = True
+
     def toggle_fold_trigger(self, block):
         """
         Toggle a fold trigger block (expand or collapse it).
@@ -604,7 +620,10 @@ class FoldingPanel(Panel):
         else:
             region.fold()
             self._clear_scope_decos()
-        self._refresh_editor_and_scrollbars()
+        self._update_fold_decoration(region._trigger)
+        _, end = region.get_range(ignore_blank_lines=False)
+        self._refresh_editor_and_scrollbars(
+            region._trigger, block.document().findBlockByNumber(end))
         self.trigger_state_changed.emit(region._trigger, region.collapsed)
 
     def mousePressEvent(self, event):
@@ -631,6 +650,8 @@ class FoldingPanel(Panel):
                     self._highlight_caret_scope)
                 self._block_nbr = -1
             self.editor.new_text_set.connect(self._clear_block_deco)
+            self.editor.blockCountChanged.connect(
+                self._on_block_count_changed)
         else:
             self.editor.key_pressed.disconnect(self._on_key_pressed)
             if self._highlight_caret:
@@ -638,6 +659,8 @@ class FoldingPanel(Panel):
                     self._highlight_caret_scope)
                 self._block_nbr = -1
             self.editor.new_text_set.disconnect(self._clear_block_deco)
+            self.editor.blockCountChanged.disconnect(
+                self._on_block_count_changed)
 
     def _on_key_pressed(self, event):
         """
@@ -673,18 +696,6 @@ class FoldingPanel(Panel):
                         tc.setPosition(end, tc.KeepAnchor)
                         self.editor.setTextCursor(tc)
 
-    @staticmethod
-    def _show_previous_blank_lines(block):
-        """
-        Show the block previous blank lines
-        """
-        # set previous blank lines visibles
-        pblock = block.previous()
-        while (pblock.text().strip() == '' and
-               pblock.blockNumber() >= 0):
-            pblock.setVisible(True)
-            pblock = pblock.previous()
-
     def refresh_decorations(self, force=False):
         """
         Refresh decorations colors. This function is called by the syntax
@@ -695,16 +706,15 @@ class FoldingPanel(Panel):
         cursor = self.editor.textCursor()
         if (self._prev_cursor is None or force or
                 self._prev_cursor.blockNumber() != cursor.blockNumber()):
-            for deco in self._block_decos:
-                self.editor.decorations.remove(deco)
-            for deco in self._block_decos:
+            for deco in self._block_decos.values():
                 deco.set_outline(drift_color(
                     self._get_scope_highlight_color(), 110))
                 deco.set_background(self._get_scope_highlight_color())
-                self.editor.decorations.append(deco)
+            if self._block_decos:
+                self.editor.decorations.refresh()
         self._prev_cursor = cursor
 
-    def _refresh_editor_and_scrollbars(self):
+    def _refresh_editor_and_scrollbars(self, first=None, last=None):
         """
         Refrehes editor content and scollbars.
 
@@ -714,8 +724,17 @@ class FoldingPanel(Panel):
         http://www.qtcentre.org/threads/44803 and we apply the same solution
         (don't worry, there is no visual effect, the editor does not grow up
         at all, even with a value = 500)
+
+        :param first: first block to refresh, the whole document is
+            refreshed if None.
+        :param last: last block to refresh.
         """
-        TextHelper(self.editor).mark_whole_doc_dirty()
+        if first is None or last is None or not last.isValid():
+            TextHelper(self.editor).mark_whole_doc_dirty()
+        else:
+            self.editor.document().markContentsDirty(
+                first.position(),
+                last.position() + last.length() - first.position())
         self.editor.repaint()
         s = self.editor.size()
         s.setWidth(s.width() + 1)
@@ -727,21 +746,21 @@ class FoldingPanel(Panel):
         invisible.
         """
         self._clear_block_deco()
-        block = self.editor.document().firstBlock()
-        last = self.editor.document().lastBlock()
-        while block.isValid():
-            lvl = TextBlockHelper.get_fold_lvl(block)
-            trigger = TextBlockHelper.is_fold_trigger(block)
-            if trigger:
-                if lvl == 0:
-                    self._show_previous_blank_lines(block)
-                TextBlockHelper.set_collapsed(block, True)
-            block.setVisible(lvl == 0)
-            if block == last and block.text().strip() == '':
-                block.setVisible(True)
-                self._show_previous_blank_lines(block)
-            block = block.next()
-        self._refresh_editor_and_scrollbars()
+        document = self.editor.document()
+        index = _FoldIndex.get(document)
+        triggers, scopes = index.scopes()
+        entries = index.entries()
+        # blocks with a fold level > 0 are hidden, except the blank lines
+        # before top level triggers and at the end of the document
+        visible = [entry < 4 for entry in entries]
+        for nbr in [t for t in triggers if not scopes[t][0]] + [
+                len(entries)]:
+            nbr -= 1
+            while nbr >= 0 and entries[nbr] & 1:
+                visible[nbr] = True
+                nbr -= 1
+        self._refresh_editor_and_scrollbars(*_apply_fold_states(
+            document, visible, dict.fromkeys(triggers, True)))
         tc = self.editor.textCursor()
         tc.movePosition(tc.Start)
         self.editor.setTextCursor(tc)
@@ -751,23 +770,56 @@ class FoldingPanel(Panel):
         """
         Clear the folded block decorations.
         """
-        for deco in self._block_decos:
-            self.editor.decorations.remove(deco)
-        self._block_decos[:] = []
+        with self.editor.decorations.batch():
+            for deco in self._block_decos.values():
+                self.editor.decorations.remove(deco)
+        self._block_decos.clear()
+        self._block_decos_moved = False
 
     def expand_all(self):
         """
         Expands all fold triggers.
         """
-        block = self.editor.document().firstBlock()
-        while block.isValid():
-            TextBlockHelper.set_collapsed(block, False)
-            block.setVisible(True)
-            block = block.next()
+        document = self.editor.document()
+        triggers, _ = _FoldIndex.get(document).scopes()
+        first, last = _apply_fold_states(
+            document, [True] * document.blockCount(),
+            dict.fromkeys(triggers, False))
         self._clear_block_deco()
-        self._refresh_editor_and_scrollbars()
+        self._refresh_editor_and_scrollbars(first, last)
         self.expand_all_triggered.emit()
 
+    def collapsed_lines(self):
+        """
+        Returns the list of collapsed fold trigger lines (0 based).
+        """
+        document = self.editor.document()
+        triggers, _ = _FoldIndex.get(document).scopes()
+        return [nbr for nbr in triggers if TextBlockHelper.is_collapsed(
+            document.findBlockByNumber(nbr))]
+
+    def set_collapsed_lines(self, lines):
+        """
+        Collapses the fold triggers found at the specified lines and expands
+        all the other ones, in a single pass over the document.
+
+        Lines that are not (or no longer) fold triggers are ignored.
+
+        :param lines: list of fold trigger lines (0 based).
+        """
+        document = self.editor.document()
+        triggers, scopes = _FoldIndex.get(document).scopes()
+        collapsed = dict.fromkeys(triggers, False)
+        visible = [True] * document.blockCount()
+        for nbr in lines:
+            if nbr in scopes and scopes[nbr][2] > nbr:
+                collapsed[nbr] = True
+                end = scopes[nbr][2]
+                visible[nbr + 1:end + 1] = [False] * (end - nbr)
+        first, last = _apply_fold_states(document, visible, collapsed)
+        self._clear_block_deco()
+        self._refresh_editor_and_scrollbars(first, last)
+
     def _on_action_toggle(self):
         """
         Toggle the current fold trigger.
@@ -19,7 +19,8 @@ class SearchAndReplacePanel(Panel, Ui_SearchPanel):
     """ Lets the user search and replace text in the current document.
 
     It uses the backend API to search for some text. Search operation is
-    performed in a background process (the backend process)..
+    performed in process for small documents and in a background process (the
+    backend process) for big documents.
 
     The search panel can also be used programatically. To do that, the client
     code must first requests a search using :meth:`requestSearch` and connects
@@ -214,10 +215,10 @@ class SearchAndReplacePanel(Panel, Ui_SearchPanel):
 
     def _refresh_decorations(self):
         for deco in self._decorations:
-            self.editor.decorations.remove(deco)
             deco.set_background(QtGui.QBrush(self.background))
             deco.set_outline(self._outline)
-            self.editor.decorations.append(deco)
+        if self._decorations:
+            self.editor.decorations.refresh()
 
     def on_state_changed(self, state):
         super(SearchAndReplacePanel, self).on_state_changed(state)
@@ -518,15 +519,42 @@ class SearchAndReplacePanel(Panel, Ui_SearchPanel):
         """
         Replaces all occurrences in the editor's document.
 
+        All the occurrences found by the last search are replaced back to
+        front in a single edit block: positions of the remaining occurrences
+        do not need to be updated, the operation can be undone in one step
+        and the document is rehighlighted only once.
+
         :param text: The replacement text. If None, the content of the lineEdit
                      replace will be used instead
         """
+        if text is None or isinstance(text, bool):
+            text = self.lineEditReplace.text()
+        occurrences = sorted(self.get_occurences(), reverse=True)
+        if not occurrences:
+            return
+        self._clear_decorations()
+        try:
+            # prevent search request due to editor textChanged
+            self.editor.textChanged.disconnect(self.request_search)
+        except (RuntimeError, TypeError):
+            # already disconnected
+            pass
         cursor = self.editor.textCursor()
         cursor.beginEditBlock()
-        remains = self.replace(text=text)
-        while remains:
-            remains = self.replace(text=text)
-        cursor.endEditBlock()
+        try:
+            for start, end in occurrences:
+                cursor.setPosition(start)
+                cursor.setPosition(end, cursor.KeepAnchor)
+                cursor.insertText(text)
+        finally:
+            cursor.endEditBlock()
+            self.editor.textChanged.connect(self.request_search)
+        self._clear_occurrences()
+        self._set_current_occurrence(-1)
+        self.cpt_occurences = 0
+        self._update_label_matches()
+        self._update_buttons()
+        self.request_search()
 
     def eventFilter(self, obj, event):
         if event.type() == QtCore.QEvent.KeyPress:
@@ -579,8 +607,8 @@ class SearchAndReplacePanel(Panel, Ui_SearchPanel):
             'case_sensitive': case_sensitive
         }
         try:
-            self.editor.backend.send_request(findall, request_data,
-                                             self._on_results_available)
+            self.editor.backend.send_adaptive_request(
+                findall, request_data, len(text), self._on_results_available)
         except AttributeError:
             self._on_results_available(findall(request_data))
         except NotRunning:
@@ -605,11 +633,12 @@ class SearchAndReplacePanel(Panel, Ui_SearchPanel):
         self._clear_decorations()
         all_occurences = self.get_occurences()
         occurrences = all_occurences[:self.MAX_HIGHLIGHTED_OCCURENCES]
-        for i, occurrence in enumerate(occurrences):
-            deco = self._create_decoration(occurrence[0],
-                                           occurrence[1])
-            self._decorations.append(deco)
-            self.editor.decorations.append(deco)
+        with self.editor.decorations.batch():
+            for i, occurrence in enumerate(occurrences):
+                deco = self._create_decoration(occurrence[0],
+                                               occurrence[1])
+                self._decorations.append(deco)
+                self.editor.decorations.append(deco)
         self.cpt_occurences = len(all_occurences)
         if not self.cpt_occurences:
             self._current_occurrence_index = -1
@@ -637,8 +666,9 @@ class SearchAndReplacePanel(Panel, Ui_SearchPanel):
 
     def _clear_decorations(self):
         """ Remove all decorations """
-        for deco in self._decorations:
-            self.editor.decorations.remove(deco)
+        with self.editor.decorations.batch():
+            for deco in self._decorations:
+                self.editor.decorations.remove(deco)
         self._decorations[:] = []
 
     def _set_current_occurrence(self, current_occurence_index):
@@ -647,14 +677,8 @@ class SearchAndReplacePanel(Panel, Ui_SearchPanel):
     def _remove_occurrence(self, i, offset=0):
         self._occurrences.pop(i)
         if offset:
-            updated_occurences = []
-            for j, occ in enumerate(self._occurrences):
-                if j >= i:
-                    updated_occurences.append(
-                        (occ[0] + offset, occ[1] + offset))
-                else:
-                    updated_occurences.append((occ[0], occ[1]))
-            self._occurrences = updated_occurences
+            self._occurrences[i:] = [(start + offset, end + offset)
+                                     for start, end in self._occurrences[i:]]
 
     def _update_buttons(self, txt=""):
         enable = self.cpt_occurences > 1
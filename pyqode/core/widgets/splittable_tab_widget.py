@@ -506,6 +506,7 @@ class BaseTabWidget(QtWidgets.QTabWidget):
         if widget is None:
             return
         try:
+            # keep the document alive, it might be shared with clones
             document = widget.document()
         except AttributeError:
             document = None  # not a QPlainTextEdit
@@ -522,7 +523,11 @@ class BaseTabWidget(QtWidgets.QTabWidget):
             widget.setParent(None)
         else:
             try:
-                clones[0].syntax_highlighter.setDocument(document)
+                # the first clone now highlights the shared document
+                highlighter = clones[0].syntax_highlighter
+                highlighter.share_document(None)
+                for clone in clones[1:]:
+                    clone.syntax_highlighter.share_document(highlighter)
             except AttributeError:
                 pass  # not a QPlainTextEdit
 
@@ -10,6 +10,7 @@ from pyqode.core.api import CodeEdit
 from pyqode.core.api.panel import Panel
 from pyqode.core.api.utils import TextHelper
 from pyqode.core import panels, modes
+from pyqode.core.widgets import GenericCodeEdit
 
 from pyqode.qt import QtWidgets, QtCore, QtGui
 from pyqode.qt.QtTest import QTest
@@ -352,6 +353,35 @@ def test_clone(editor):
     assert editor.document() == new.document()
 
 
+def test_clone_shares_highlighter():
+    editor = GenericCodeEdit()
+    editor.file.open(__file__)
+    highlighter = editor.syntax_highlighter
+    new = editor.split()
+    clone_highlighter = new.syntax_highlighter
+    # the shared document is highlighted by the original highlighter only
+    assert highlighter.document() == editor.document()
+    assert clone_highlighter.document() is None
+    clone_highlighter.enabled = False
+    clone_highlighter.enabled = True
+    assert clone_highlighter.document() is None
+    highlighted = []
+    highlight_block = highlighter.highlight_block
+
+    def count(text, block):
+        highlighted.append(block.blockNumber())
+        highlight_block(text, block)
+
+    highlighter.highlight_block = count
+    clone_highlighter.rehighlight()
+    assert len(highlighted) == editor.document().blockCount()
+    # the clone highlights the document once the original has been closed
+    editor.close(clear=False)
+    clone_highlighter.share_document(None)
+    assert clone_highlighter.document() == new.document()
+    new.close()
+
+
 def test_cut_empty_line(editor):
     assert isinstance(editor, CodeEdit)
     editor.setPlainText('''
@@ -4,7 +4,7 @@ This module tests the extension frontend module
 (pyqode.core.api.decoration and pyqode.core.managers.TextDecorationManager)
 """
 from pyqode.core.api import TextHelper, TextDecoration
-from pyqode.qt import QtGui
+from pyqode.qt import QtCore, QtGui
 from ..helpers import editor_open
 
 
@@ -62,6 +62,28 @@ def test_constructors(editor):
                                    start_pos=10, end_pos=15)
     deco = TextDecoration(editor.textCursor(),
                                    start_line=10, end_line=15)
+    document = editor.document()
+    assert deco.cursor.selectionStart() == \
+        document.findBlockByNumber(10).position()
+    assert deco.cursor.selectionEnd() == \
+        document.findBlockByNumber(15).position()
+    # past the end of the document: clamped to the last line
+    deco = TextDecoration(editor.textCursor(), start_line=100000)
+    assert deco.cursor.position() == document.lastBlock().position()
+
+
+@editor_open(__file__)
+def test_lazy_signals(editor):
+    deco = TextDecoration(editor.textCursor(), start_pos=10, end_pos=15)
+    assert deco._signals is None
+    clicked = []
+    deco.signals.clicked.connect(clicked.append)
+    assert deco.signals is deco.signals
+    deco.signals.clicked.emit(deco)
+    assert clicked == [deco]
+    # decorations still accept custom attributes
+    deco.block = editor.document().firstBlock()
+    assert deco.block.blockNumber() == 0
 
 
 @editor_open(__file__)
@@ -74,3 +96,122 @@ def test_formats(editor):
     deco.set_as_error(QtGui.QColor('#FF0000'))
     deco.set_as_error()
     deco.set_as_warning()
+
+
+@editor_open(__file__)
+def test_draw_order(editor):
+    editor.decorations.clear()
+    decos = [TextDecoration(editor.textCursor(), start_pos=i, end_pos=i + 1,
+                            draw_order=order)
+             for i, order in enumerate([2, 0, 1, 0, 2])]
+    for deco in decos:
+        editor.decorations.append(deco)
+    # sorted by draw order, insertion order is kept for equal draw orders
+    assert list(editor.decorations) == [
+        decos[1], decos[3], decos[2], decos[0], decos[4]]
+    assert editor.decorations.remove(decos[3])
+    assert decos[3] not in editor.decorations
+    assert list(editor.decorations) == [decos[1], decos[2], decos[0],
+                                        decos[4]]
+    editor.decorations.clear()
+
+
+@editor_open(__file__)
+def test_batch(editor):
+    editor.decorations.clear()
+    decos = [TextDecoration(editor.textCursor(), start_line=i, end_line=i + 1)
+             for i in range(10)]
+    with editor.decorations.batch():
+        for deco in decos:
+            editor.decorations.append(deco)
+        with editor.decorations.batch():
+            editor.decorations.remove(decos[0])
+        # extra selections are not updated until the end of the batch
+        assert editor.extraSelections() == []
+    assert len(editor.extraSelections()) == 9
+    with editor.decorations.batch():
+        for deco in decos:
+            editor.decorations.remove(deco)
+    assert editor.extraSelections() == []
+
+
+@editor_open(__file__)
+def test_at_position(editor):
+    editor.decorations.clear()
+    outer = TextDecoration(editor.textCursor(), start_pos=0, end_pos=100,
+                           draw_order=1)
+    inner = TextDecoration(editor.textCursor(), start_pos=10, end_pos=20)
+    other = TextDecoration(editor.textCursor(), start_pos=50, end_pos=60)
+    with editor.decorations.batch():
+        for deco in [outer, inner, other]:
+            editor.decorations.append(deco)
+    assert editor.decorations.at_position(15) == [inner, outer]
+    assert editor.decorations.at_position(30) == [outer]
+    assert editor.decorations.at_position(200) == []
+    # the index follows the text edits
+    cursor = editor.textCursor()
+    cursor.setPosition(0)
+    cursor.insertText('#' * 10)
+    assert editor.decorations.at_position(15) == [outer]
+    assert editor.decorations.at_position(25) == [inner, outer]
+    assert editor.decorations.at_position(65) == [other, outer]
+    editor.decorations.remove(inner)
+    assert editor.decorations.at_position(25) == [outer]
+    editor.decorations.clear()
+    assert editor.decorations.at_position(25) == []
+
+
+def test_viewport_culling(editor):
+    editor.decorations.clear()
+    editor.setPlainText('foo\n' * 1000, 'text/plain', 'utf-8')
+    manager = editor.decorations
+    decos = [TextDecoration(editor.textCursor(), start_line=i, end_line=i)
+             for i in range(1000)]
+    with manager.batch():
+        for deco in decos:
+            manager.append(deco)
+    first, last = manager._visible_block_range()
+    nb_selections = len(editor.extraSelections())
+    assert nb_selections < 1000
+    assert nb_selections >= last - first + 1
+    # decorations are handed to Qt when the editor is scrolled
+    TextHelper(editor).goto_line(999)
+    editor.centerCursor()
+    editor.verticalScrollBar().setValue(editor.verticalScrollBar().maximum())
+    lines = [sel.cursor.blockNumber() for sel in editor.extraSelections()]
+    assert 999 in lines
+    assert 0 not in lines
+    with manager.batch():
+        for deco in decos:
+            manager.remove(deco)
+    assert len(editor.extraSelections()) == len(manager)
+
+
+@editor_open(__file__)
+def test_at_cursor(editor):
+    editor.decorations.clear()
+    message = TextDecoration(editor.textCursor(), start_line=3,
+                             tooltip='message', draw_order=3)
+    message.set_full_width()
+    block = editor.document().findBlockByNumber(5)
+    word = TextDecoration(editor.textCursor(), start_pos=block.position(),
+                          end_pos=block.position() + 4)
+    editor.decorations.append(message)
+    editor.decorations.append(word)
+    cursor = editor.textCursor()
+    cursor.setPosition(editor.document().findBlockByNumber(3).position())
+    assert editor.decorations.at_cursor(cursor) == [message]
+    cursor.setPosition(block.position() + 2)
+    assert editor.decorations.at_cursor(cursor) == [word]
+    cursor.setPosition(block.position() + 6)
+    assert editor.decorations.at_cursor(cursor) == []
+    # clicks are dispatched to the decoration under the mouse
+    clicked = []
+    word.signals.clicked.connect(clicked.append)
+    cursor.setPosition(block.position() + 2)
+    pos = editor.cursorRect(cursor).center()
+    editor.mousePressEvent(QtGui.QMouseEvent(
+        QtCore.QEvent.MouseButtonPress, QtCore.QPointF(pos),
+        QtCore.Qt.LeftButton, QtCore.Qt.LeftButton, QtCore.Qt.NoModifier))
+    assert clicked == [word]
+    editor.decorations.clear()
@@ -178,3 +178,34 @@ class DynamicFoldDetectorTestCase(object):
 ])
 def test_fold_detection_dynamic(editor, case):
     case.execute(editor)
+
+
+def test_fold_index(editor):
+    editor.setPlainText('def a():\n    x = 1\n    def b():\n        y = 2\n'
+                        '\n\n    z = 3\nw = 4', 'text/x-python', 'utf-8')
+    editor.syntax_highlighter.rehighlight()
+    doc = editor.document()
+    a = folding.FoldScope(doc.findBlockByNumber(0))
+    b = folding.FoldScope(doc.findBlockByNumber(2))
+    assert a.get_range() == (0, 6)
+    assert b.get_range() == (2, 3)
+    assert b.get_range(ignore_blank_lines=False) == (2, 5)
+    assert b.parent().get_range() == a.get_range()
+    assert a.parent() is None
+    assert [s.get_range() for s in a.child_regions()] == [(2, 3)]
+    assert folding.FoldScope.find_parent_scope(
+        doc.findBlockByNumber(6)).blockNumber() == 0
+    # the index follows the edits
+    TextHelper(editor).goto_line(0, 0)
+    editor.textCursor().insertText('import os\n\n')
+    b = folding.FoldScope(doc.findBlockByNumber(4))
+    assert b.get_range() == (4, 5)
+    assert b.parent().get_range() == (2, 8)
+    # there is no limit on the distance to the parent scope
+    TextHelper(editor).goto_line(4, 0)
+    editor.textCursor().insertText('    pass\n' * 6000)
+    block = doc.findBlockByNumber(6005)
+    assert block.text().strip() == 'y = 2'
+    assert folding.FoldScope.find_parent_scope(block).blockNumber() == 6004
+    assert folding.FoldScope.find_parent_scope(
+        doc.findBlockByNumber(6000)).blockNumber() == 2
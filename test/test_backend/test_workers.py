@@ -29,7 +29,8 @@ def test_code_completion_worker():
     completion_groups = worker(data)
     context = completion_groups[0]
     completion_groups = completion_groups[1:]
-    line, column, req_id = context
+    line, column, req_id, timings = context
+    assert timings[0][0] == 'DocumentWordsProvider'
     assert req_id == 47
     assert line == 1
     assert column == 0
@@ -45,6 +46,81 @@ def test_code_completion_worker():
                 found = True
                 break
     assert found
+    workers.CodeCompletionWorker.providers[:] = []
+
+
+class _Provider(object):
+    def __init__(self, names, priority=0, delay=0):
+        self.names = names
+        self.priority = priority
+        self.timeout = 0.5
+        self.delay = delay
+
+    def complete(self, *args):
+        import time
+        time.sleep(self.delay)
+        return [{'name': name, 'tooltip': str(self.priority)}
+                for name in self.names]
+
+
+def test_code_completion_worker_merge():
+    workers.CodeCompletionWorker.providers[:] = [
+        _Provider(['spam', 'eggs']),
+        _Provider(['eggs', 'ham'], priority=1),
+        _Provider(['slow'], delay=2)]
+    data = {'code': '', 'line': 0, 'column': 0, 'path': '',
+            'encoding': 'utf-8', 'prefix': '', 'request_id': 0}
+    try:
+        context, completions = workers.CodeCompletionWorker()(data)
+    finally:
+        workers.CodeCompletionWorker.providers[:] = []
+    # results of all providers are merged and deduplicated, higher priority
+    # first
+    assert [(c['name'], c['tooltip']) for c in completions] == [
+        ('eggs', '1'), ('ham', '1'), ('spam', '0')]
+    # the slow provider exceeded its time budget
+    timings = context[3]
+    assert timings[0][1] is not None
+    assert timings[2][1] is None
+
+
+class _CountingProvider(_Provider):
+    def __init__(self, delay):
+        super(_CountingProvider, self).__init__(['slow'], delay=delay)
+        self.timeout = 0.1
+        self.running = self.max_running = self.calls = 0
+
+    def complete(self, *args):
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.running, self.max_running)
+        try:
+            return super(_CountingProvider, self).complete(*args)
+        finally:
+            self.running -= 1
+
+
+def test_code_completion_worker_busy_provider():
+    import time
+    prov = _CountingProvider(delay=0.5)
+    workers.CodeCompletionWorker.providers[:] = [prov]
+    data = {'code': '', 'line': 0, 'column': 0, 'path': '',
+            'encoding': 'utf-8', 'prefix': '', 'request_id': 0}
+    try:
+        worker = workers.CodeCompletionWorker()
+        worker(data)
+        # the provider is still running, it is not called again
+        context, completions = worker(data)
+        assert context[3][0][1] is None
+        assert prov.calls == 1
+        time.sleep(0.6)
+        prov.delay = 0
+        context, completions = worker(data)
+        assert [c['name'] for c in completions] == ['slow']
+        assert prov.calls == 2
+        assert prov.max_running == 1
+    finally:
+        workers.CodeCompletionWorker.providers[:] = []
 
 with open('test/files/foo.py', 'r') as f:
     foo_py = f.read()
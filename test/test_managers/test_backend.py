@@ -6,6 +6,7 @@ from pyqode.qt import QtWidgets
 import pytest
 from pyqode.qt.QtTest import QTest
 from pyqode.core import backend
+from pyqode.core.backend import workers
 from pyqode.core.managers.backend import BackendManager
 from ..helpers import cwd_at, python2_path, server_path, wait_for_connected
 
@@ -95,3 +96,31 @@ def test_frozen_server():
         backend_manager.send_request(
             backend.echo_worker, 'some data', on_receive=_on_receive)
     backend_manager.start('server.exe')
+
+
+def test_adaptive_request():
+    win = QtWidgets.QMainWindow()
+    manager = BackendManager(win)
+    results = []
+    data = {'string': 'foo bar foo', 'sub': 'foo', 'regex': False,
+            'whole_word': True, 'case_sensitive': False}
+    # small jobs are run in process, even if the backend is not running
+    manager.send_adaptive_request(workers.findall, data, 11, results.extend)
+    assert results == [(0, 3), (8, 11)]
+    assert manager._local_time_per_char is not None
+    # big jobs are sent to the backend
+    with pytest.raises(NotRunning):
+        manager.send_adaptive_request(
+            workers.findall, data, manager.local_job_size_limit,
+            results.extend)
+    # the limit is tuned from the measured round-trip time
+    manager._local_time_per_char = 0.001
+    manager._update_round_trip_time(0.01)
+    assert manager.local_job_size_limit == 10
+    # errors of in process jobs are logged, no results are returned
+    results = []
+    data['sub'] = '('
+    data['regex'] = True
+    manager.send_adaptive_request(workers.findall, data, 1, results.append)
+    assert results == [[]]
+    del win
@@ -84,3 +84,106 @@ def test_preferred_encodings(editor, preferred_eol):
         print(f.read())
         assert f.newlines == editor.file.EOL.string(preferred_eol)
     os.remove(fn)
+
+
+def test_restore_fold_state(editor, tmpdir):
+    path = str(tmpdir.join('fold_state.py'))
+    with open(path, 'w') as f:
+        f.write('def foo():\n    return 1\n\n\ndef bar():\n    return 2\n')
+    panel = editor.panels.get(panels.FoldingPanel)
+    # let the highlighter process its pending rehighlight
+    QTest.qWait(10)
+    editor.file.open(path)
+    panel.toggle_fold_trigger(editor.document().findBlockByNumber(4))
+    assert panel.collapsed_lines() == [4]
+    editor.file.close()
+    editor.file.open(path)
+    assert panel.collapsed_lines() == [4]
+    assert not editor.document().findBlockByNumber(5).isVisible()
+    assert editor.document().findBlockByNumber(1).isVisible()
+    # the fold state is dropped if the file changed
+    editor.file.close()
+    with open(path, 'a') as f:
+        f.write('\n')
+    editor.file.open(path)
+    assert panel.collapsed_lines() == []
+    assert editor.document().findBlockByNumber(5).isVisible()
+
+
+def test_restore_fold_state_pending(editor, tmpdir):
+    code = 'def foo():\n    return 1\n\n\ndef bar():\n    return 2\n'
+    path = str(tmpdir.join('fold_state.py'))
+    other = str(tmpdir.join('other.py'))
+    with open(path, 'w') as f:
+        f.write(code)
+    with open(other, 'w') as f:
+        f.write(code.replace('1', '3'))
+    panel = editor.panels.get(panels.FoldingPanel)
+    highlighter = editor.syntax_highlighter
+    QTest.qWait(10)
+    editor.file.open(path)
+    panel.toggle_fold_trigger(editor.document().findBlockByNumber(4))
+    editor.file.close()
+    highlighter.CHUNKED_REHIGHLIGHT_THRESHOLD = 1
+    try:
+        # the fold state is restored once the whole file is highlighted
+        editor.file.open(path)
+        assert highlighter.rehighlight_in_progress
+        assert panel.collapsed_lines() == []
+        while highlighter.rehighlight_in_progress:
+            QTest.qWait(10)
+        assert panel.collapsed_lines() == [4]
+        # but not on another file opened in the meantime
+        editor.file.close()
+        editor.file.open(path)
+        editor.file.close()
+        editor.file.open(other)
+        while highlighter.rehighlight_in_progress:
+            QTest.qWait(10)
+        assert panel.collapsed_lines() == []
+        editor.file.close()
+    finally:
+        del highlighter.CHUNKED_REHIGHLIGHT_THRESHOLD
+
+
+def test_cache_fold_state_disabled_panel(editor, tmpdir):
+    from pyqode.core.cache import Cache
+    path = str(tmpdir.join('fold_state.py'))
+    with open(path, 'w') as f:
+        f.write('def foo():\n    return 1\n')
+    panel = editor.panels.get(panels.FoldingPanel)
+    QTest.qWait(10)
+    editor.file.open(path)
+    Cache().set_fold_state(path, [0], 1)
+    panel.enabled = False
+    try:
+        # fold scopes are not computed when the panel is disabled
+        panel.collapsed_lines = None
+        editor.file.close()
+        assert Cache().get_fold_state(path) == ([0], 1)
+    finally:
+        del panel.collapsed_lines
+        panel.enabled = True
+
+
+def test_open_big_file(tmpdir):
+    from pyqode.core.api import CodeEdit
+    from pyqode.core import modes
+    path = str(tmpdir.join('big_file.py'))
+    with open(path, 'w') as f:
+        f.write('def foo():\n    return 1\n' * 10)
+    editor = CodeEdit()
+    highlighter = editor.modes.append(
+        modes.PygmentsSyntaxHighlighter(editor.document()))
+    panel = editor.panels.append(panels.FoldingPanel())
+    editor.file.file_size_limit = 10
+    try:
+        editor.file.open(path)
+        # big files are only highlighted around the viewport, without code
+        # folding
+        assert highlighter.viewport_only
+        assert not panel.enabled
+        assert panel.isHidden()
+    finally:
+        editor.close(clear=False)
+        del editor
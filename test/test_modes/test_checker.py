@@ -3,6 +3,7 @@ from pyqode.qt.QtTest import QTest
 import sys
 import pytest
 from pyqode.core import modes, panels
+from pyqode.core.api import CodeEdit
 
 from ..helpers import wait_for_connected, editor_open
 from ..helpers import server_path
@@ -57,6 +58,7 @@ def test_remove_message(editor):
     mode.clear_messages()
     status = [modes.CheckerMessages.ERROR, modes.CheckerMessages.WARNING,
               modes.CheckerMessages.INFO]
+    mode.limit = 200
     mode.add_messages([modes.CheckerMessage('desc', modes.CheckerMessages.ERROR,
                                             10 + i)
                        for i in range(mode.limit * 2)])
@@ -68,6 +70,109 @@ def test_remove_message(editor):
     QTest.qWait(5000)
     assert len(mode._messages) == mode.limit - 1
     mode.clear_messages()
+    mode.limit = None
+
+
+@editor_open(__file__)
+def test_reconcile_messages(editor):
+    mode = get_mode(editor)
+    mode.clear_messages()
+
+    def messages(lines, status=modes.CheckerMessages.ERROR):
+        return [modes.CheckerMessage('desc', status, line) for line in lines]
+
+    mode.add_messages(messages(range(10, 60)))
+    while not mode._finished:
+        QTest.qWait(10)
+    assert len(mode.messages) == 50
+    kept = {msg.line: msg for msg in mode.messages}
+    # unchanged messages are kept, others are replaced
+    mode.add_messages(messages(range(30, 80)) +
+                      messages([10], modes.CheckerMessages.WARNING))
+    while not mode._finished:
+        QTest.qWait(10)
+    assert len(mode.messages) == 51
+    lines = sorted(msg.line for msg in mode.messages)
+    assert lines == [10] + list(range(30, 80))
+    for msg in mode.messages:
+        if 30 <= msg.line < 60:
+            assert msg is kept[msg.line]
+        assert msg.decoration in editor.decorations
+        assert msg.block.userData().messages == [msg]
+    assert kept[10].decoration not in editor.decorations
+    # kept messages follow the lines inserted above them
+    kept = {msg.line: msg for msg in mode.messages}
+    cursor = editor.textCursor()
+    cursor.setPosition(0)
+    cursor.insertText('\n\n')
+    mode.add_messages(messages(range(32, 82)))
+    while not mode._finished:
+        QTest.qWait(10)
+    for msg in mode.messages:
+        assert msg is kept[msg.line - 2]
+        assert msg.block.blockNumber() == msg.line
+    # duplicated messages are displayed once
+    mode.add_messages(messages([5, 5]))
+    while not mode._finished:
+        QTest.qWait(10)
+    assert len(mode.messages) == 1
+    mode.clear_messages()
+
+
+@editor_open(__file__)
+def test_incremental(editor):
+    mode = get_mode(editor)
+    mode.clear_messages()
+    mode._on_work_finished([('desc', 2, line) for line in (10, 20, 30)])
+    while not mode._finished:
+        QTest.qWait(10)
+    kept = {msg.line: msg for msg in mode.messages}
+    # edits are not tracked unless the mode is incremental
+    cursor = editor.textCursor()
+    cursor.setPosition(editor.document().findBlockByNumber(15).position())
+    cursor.insertText('\n')
+    assert mode._dirty_region() is None
+    mode.incremental = True
+    try:
+        cursor.insertText('x\n')
+        region = mode._dirty_region()
+        assert region == [16, 17]
+        mode._on_work_finished({'region': region,
+                                'messages': [('new', 1, 16)]})
+        while not mode._finished:
+            QTest.qWait(10)
+        lines = sorted(msg.line for msg in mode.messages)
+        assert lines == [10, 16, 22, 32]
+        for msg in mode.messages:
+            if msg.line != 16:
+                assert msg is kept[msg.line - 2 if msg.line > 16 else 10]
+    finally:
+        mode.incremental = False
+        mode._dirty = None
+        mode.clear_messages()
+
+
+@editor_open(__file__)
+def test_pending_batches(editor):
+    mode = get_mode(editor)
+    mode.clear_messages()
+
+    def displayed():
+        while not mode._finished:
+            QTest.qWait(10)
+        return sorted((msg.line, msg.description) for msg in mode.messages)
+
+    mode._on_work_finished([('desc', 2, line) for line in (10, 20, 30)])
+    # results received before the previous ones are displayed are not lost
+    mode._on_work_finished({'region': [10, 10], 'messages': [('a', 1, 10)]})
+    mode._on_work_finished({'region': [20, 20], 'messages': [('b', 1, 20)]})
+    assert displayed() == [(10, 'a'), (20, 'b'), (30, 'desc')]
+    # a full set of messages replaces the pending ones
+    mode._on_work_finished({'region': [30, 30], 'messages': []})
+    mode._on_work_finished([('c', 0, 5)])
+    mode._on_work_finished({'region': [6, 6], 'messages': [('d', 0, 6)]})
+    assert displayed() == [(5, 'c'), (6, 'd')]
+    mode.clear_messages()
 
 
 @editor_open(__file__)
@@ -94,3 +199,26 @@ def check(data):
         return [('desc', i % 3, 10 + i) for i in range(150)]
     else:
         return [('desc', i % 3, 10 + i) for i in range(20)]
+
+
+class _CheckerEdit(CodeEdit):
+    def __init__(self, parent=None):
+        super(_CheckerEdit, self).__init__(parent)
+        self.modes.append(modes.CheckerMode(check))
+
+
+def test_split_and_close_clone():
+    editor = _CheckerEdit()
+    editor.modes.get(modes.CheckerMode).incremental = True
+    editor.setPlainText('a = 1\nb = 2\n', 'text/x-python', 'utf-8')
+    clone = editor.split()
+    mode = clone.modes.get(modes.CheckerMode)
+    assert mode.incremental
+    # the clone tracks the edits of the shared document
+    cursor = editor.textCursor()
+    cursor.setPosition(editor.document().findBlockByNumber(1).position())
+    cursor.insertText('c = 3\n')
+    assert mode._dirty_region() == [1, 2]
+    # closing the clone disconnects it from the shared document
+    clone.close()
+    editor.close()
@@ -10,6 +10,7 @@ from pyqode.qt.QtTest import QTest
 from pyqode.core.api import TextHelper
 from pyqode.core import modes
 from pyqode.core.modes.code_completion import SubsequenceCompleter
+from pyqode.core.modes.code_completion import SubsequenceMatcher
 from ..helpers import server_path, wait_for_connected
 from ..helpers import ensure_visible, ensure_connected
 
@@ -228,3 +229,73 @@ def test_subsequence_completer(case):
         completer.setCompletionPrefix('action')
         completer.update_model()
         assert completer.completionCount() == 2
+
+
+def test_subsequence_matcher():
+    matcher = SubsequenceMatcher()
+    matcher.set_candidates(['setStatusTip', 'geTToolTip', 'seTToolTip',
+                            'actionA'])
+    assert matcher.match('') == [0, 1, 2, 3]
+    assert matcher.match('t') == [0, 1, 2, 3]
+    assert matcher.match('tip') == [1, 2, 0]
+    # narrowed down from the previous matches
+    assert matcher.match('tipx') == []
+    # longer heads are favoured
+    assert matcher.match('settip') == [2, 0]
+    assert matcher.match('settip', case_sensitive=True) == []
+    assert matcher.match('seTTip', case_sensitive=True) == [2]
+    # matching case is favoured
+    matcher.set_candidates(['tooltip', 'ToolTip'])
+    assert matcher.match('tip') == [0, 1]
+    assert matcher.match('Tip') == [1, 0]
+
+
+@ensure_empty
+@ensure_connected
+def test_completion_cache(editor):
+    mode = get_mode(editor)
+    mode._reset_sync_data()
+    helper = TextHelper(editor)
+
+    def shown():
+        model = mode._completer.model()
+        return [model.index(i, 0).data() for i in range(model.rowCount())]
+
+    requests = []
+    editor.backend.send_request = lambda *args, **kwargs: requests.append(
+        kwargs['args'])
+    try:
+        # line 3 is "string = 'a string'", the prefix is "str"
+        helper.goto_line(3, 3)
+        key = (mode._document_version, 3, 0)
+        mode._cache[key] = ('st', [{
+            'name': 'string', 'icon': ':/pyqode-icons/rc/edit-undo.png'}])
+        # served from the cache: results requested for a shorter prefix
+        assert mode.request_completion() is True
+        assert not requests
+        assert shown() == ['string']
+        # the results of "st" may miss completions of "s", they are
+        # requested again and the cached ones are not shown
+        mode._reset_sync_data()
+        mode._update_model([])
+        mode._model_key = None
+        helper.goto_line(3, 1)
+        assert mode.request_completion() is True
+        assert [data['prefix'] for data in requests] == ['s']
+        assert shown() == []
+    finally:
+        del editor.backend.send_request
+    mode._on_results_available([[3, 0, mode._request_id - 1],
+                                [{'name': 'self'}, {'name': 'string'}]])
+    assert mode._cache[key] == ('s', [{'name': 'self'}, {'name': 'string'}])
+    assert shown() == ['self', 'string']
+    # typing the word being completed keeps the cache valid
+    editor.textCursor().insertText('s')
+    assert key in mode._cache
+    # any other change invalidates it
+    TextHelper(editor).goto_line(0)
+    editor.textCursor().insertText('s')
+    assert not mode._cache
+    # icons are shared
+    assert mode._icon(':/pyqode-icons/rc/edit-undo.png') is \
+        mode._icon(':/pyqode-icons/rc/edit-undo.png')
@@ -1,5 +1,8 @@
+import sys
+
 from pyqode.qt.QtTest import QTest
 from pyqode.core import modes
+from pyqode.core.api import TextHelper, TextBlockHelper
 from test.helpers import editor_open
 
 
@@ -27,3 +30,234 @@ def test_apply_all_pygments_styles(editor):
         mode.pygments_style = style
         assert mode.pygments_style == style
         QTest.qWait(500)
+
+
+def _block_colors(editor):
+    colors = []
+    block = editor.document().firstBlock()
+    while block.isValid():
+        colors.append([
+            (r.start, r.length, r.format.foreground().color().name())
+            for r in block.layout().formats()])
+        block = block.next()
+    return colors
+
+
+def test_chunked_rehighlight(editor):
+    mode = get_mode(editor)
+    text = '"""\ndocstring\n"""\n' + 'a = 1\n' * 500
+    editor.setPlainText(text, 'text/x-python', 'utf-8')
+    mode.rehighlight()
+    expected = _block_colors(editor)
+    mode.CHUNKED_REHIGHLIGHT_THRESHOLD = 100
+    mode.CHUNK_DURATION = 0.001
+    try:
+        finished = []
+        mode.rehighlight_finished.connect(lambda: finished.append(True))
+        editor.setPlainText(text, 'text/x-python', 'utf-8')
+        # nothing below the viewport has been highlighted yet
+        last = editor.document().lastBlock().previous()
+        assert not last.layout().formats()
+        while not finished:
+            QTest.qWait(10)
+        # blocks highlighted out of order must get the same formats
+        assert _block_colors(editor) == expected
+    finally:
+        del mode.CHUNKED_REHIGHLIGHT_THRESHOLD
+        del mode.CHUNK_DURATION
+
+
+def test_token_runs_cache(editor):
+    from pyqode.core.modes import pygments_sh
+    mode = get_mode(editor)
+    editor.setPlainText('"""\ndocstring\n"""\n' + 'a = 1\n' * 10,
+                        'text/x-python', 'utf-8')
+    mode.rehighlight()
+    calls = []
+    lex = pygments_sh._lex
+
+    def counting_lex(*args):
+        calls.append(args[1])
+        return lex(*args)
+
+    pygments_sh._lex = counting_lex
+    try:
+        # nothing changed, the cached token runs are reused
+        mode.pygments_style = 'monokai'
+        assert calls == []
+        # only the edited block is lexed again
+        TextHelper(editor).goto_line(5, 1)
+        editor.textCursor().insertText('b')
+        assert calls == ['ab = 1']
+    finally:
+        pygments_sh._lex = lex
+
+
+def test_multiline_string_propagation(editor):
+    mode = get_mode(editor)
+    editor.setPlainText('a = 1\nb = 2\nc = 3\n', 'text/x-python', 'utf-8')
+    mode.rehighlight()
+    before = _block_colors(editor)
+    # opening a multi-line string re-highlights the next blocks
+    TextHelper(editor).goto_line(0, 0)
+    editor.textCursor().insertText('"""')
+    colors = _block_colors(editor)
+    mode.rehighlight()
+    assert colors == _block_colors(editor)
+    assert colors[2] != before[2]
+    # and closing it restores them
+    TextHelper(editor).goto_line(1, 0)
+    editor.textCursor().insertText('"""')
+    colors = _block_colors(editor)
+    mode.rehighlight()
+    assert colors == _block_colors(editor)
+    assert colors[2] == before[2]
+
+
+def test_switch_lexer(editor, monkeypatch):
+    mode = get_mode(editor)
+    # exceptions raised by highlightBlock go to sys.excepthook
+    errors = []
+    monkeypatch.setattr(sys, 'excepthook', lambda *args: errors.append(args))
+    editor.show()
+    code = 'int main() {\n    /* a\n comment */\n    return 0;\n}\n' * 500
+    editor.setPlainText(code, 'text/x-c', 'utf-8')
+    mode.set_mime_type('text/x-c')
+    mode.rehighlight()
+    while mode.rehighlight_in_progress:
+        QTest.qWait(10)
+    editor.verticalScrollBar().setValue(1000)
+    QTest.qWait(10)
+    # the block states of the C lexer must not leak into the python lexer
+    mode.set_mime_type('text/x-python')
+    mode.rehighlight()
+    while mode.rehighlight_in_progress:
+        QTest.qWait(10)
+    colors = _block_colors(editor)
+    editor.setPlainText(code, 'text/x-python', 'utf-8')
+    mode.rehighlight()
+    while mode.rehighlight_in_progress:
+        QTest.qWait(10)
+    assert errors == []
+    assert _block_colors(editor) == colors
+
+
+def test_lex_unknown_state():
+    from pygments.lexers.agile import PythonLexer
+    from pyqode.core.modes.pygments_sh import _lex
+    lexer = PythonLexer()
+    # a state of another lexer falls back to the root state
+    assert _lex(lexer, 'a = 1', ('root', 'statement')) == \
+        _lex(lexer, 'a = 1', None)
+
+
+def test_state_ids():
+    # 0xFFFF is the state of the blocks that have not been highlighted
+    assert modes.PygmentsSH.MAX_STATE_ID < 0xFFFF
+
+
+def test_lex_runs():
+    from pygments.lexers.agile import PythonLexer
+    from pygments.token import Whitespace
+    from pyqode.core.modes.pygments_sh import _lex
+    text = 'x = "a  b"'
+    runs, stack = _lex(PythonLexer(), text, None)
+    assert sum(runs[::2]) == len(text) + 1  # + the trailing newline
+    tokens = runs[1::2]
+    # white spaces have their own runs, even inside strings
+    assert tokens[1] is Whitespace
+    i = tokens.index(Whitespace, 4)
+    assert text[sum(runs[:i * 2:2]):].startswith('  b')
+    # adjacent runs of the same token are merged
+    assert all(a is not b for a, b in zip(tokens, tokens[1:]))
+
+
+def test_viewport_only(editor):
+    mode = get_mode(editor)
+    mode.VIEWPORT_CACHE_SIZE = 200
+    mode.viewport_only = True
+    try:
+        editor.setPlainText('a = 1\n' * 5000, 'text/x-python', 'utf-8')
+        QTest.qWait(100)
+        document = editor.document()
+        assert document.firstBlock().layout().formats()
+        assert not document.findBlockByNumber(4000).layout().formats()
+        first = document.firstBlock()
+        TextBlockHelper.set_fold_lvl(first, 3)
+        TextBlockHelper.set_fold_trigger(first, True)
+        TextBlockHelper.set_collapsed(first, True)
+        TextHelper(editor).goto_line(4000)
+        editor.centerCursor()
+        QTest.qWait(100)
+        assert document.findBlockByNumber(4000).layout().formats()
+        # formats of the blocks that are not shown anymore are dropped
+        assert not first.layout().formats()
+        assert TextBlockHelper.get_state(first) == -1
+        # but not their fold data
+        assert TextBlockHelper.get_fold_lvl(first) == 3
+        assert TextBlockHelper.is_fold_trigger(first)
+        assert TextBlockHelper.is_collapsed(first)
+        # the block is highlighted again when shown
+        TextHelper(editor).goto_line(0)
+        QTest.qWait(100)
+        assert first.layout().formats()
+        assert TextBlockHelper.is_collapsed(first)
+    finally:
+        mode.viewport_only = False
+        del mode.VIEWPORT_CACHE_SIZE
+
+
+def test_lexer_cache():
+    from pygments.lexers import get_lexer_for_filename
+    from pyqode.core.modes import pygments_sh
+    for filename in ['notes.txt', 'CMakeLists.txt', 'setup.py', 'a.pyw',
+                     'Makefile', 'main.c']:
+        expected = get_lexer_for_filename(filename).__class__
+        for i in range(2):
+            lexer = pygments_sh._get_lexer_for_filename(filename)
+            assert lexer.__class__ == expected
+    assert 'default' in modes.PYGMENTS_STYLES
+    assert list(modes.PYGMENTS_STYLES) == sorted(modes.PYGMENTS_STYLES)
+
+
+def test_shared_styles(editor):
+    from pyqode.core.api import ColorScheme
+    from pyqode.qt import QtGui
+    assert ColorScheme('monokai') is ColorScheme('monokai')
+    assert ColorScheme('monokai') is not ColorScheme('qt')
+    mode = get_mode(editor)
+    other = modes.PygmentsSyntaxHighlighter(QtGui.QTextDocument())
+    other.pygments_style = mode.pygments_style
+    assert other._formats is mode._formats
+
+
+def test_to_html(editor):
+    from pyqode.core.api import syntax_highlighter
+    mode = get_mode(editor)
+    editor.setPlainText('a = 1 < 2\n# comment\nb = "x"', 'text/x-python',
+                        'utf-8')
+    mode.rehighlight()
+    html = mode.to_html()
+    assert html.startswith('<pre style=')
+    assert '&lt;' in html
+    assert '<span style="' in html
+    rendered = []
+    html_style = syntax_highlighter._html_style
+
+    def count(fmt):
+        rendered.append(fmt)
+        return html_style(fmt)
+
+    syntax_highlighter._html_style = count
+    try:
+        assert mode.to_html() == html
+        assert not rendered
+        # only the edited block is rendered again
+        TextHelper(editor).goto_line(1, 0)
+        editor.textCursor().insertText('# ')
+        new_html = mode.to_html()
+        assert new_html != html
+        assert new_html.split('\n')[0] == html.split('\n')[0]
+        assert 0 < len(rendered) < 6
+    finally:
+        syntax_highlighter._html_style = html_style
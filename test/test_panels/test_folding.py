@@ -133,3 +133,52 @@ def test_enabled(editor):
 #         if TextBlockHelper.is_fold_trigger(block):
 #             assert TextBlockHelper.is_collapsed(block) is False
 #         block = block.next()
+
+
+@editor_open('test/test_api/folding_cases/foo.py')
+def test_collapse_expand_all(editor):
+    panel = get_panel(editor)
+    editor.syntax_highlighter.rehighlight()
+    panel.collapse_all()
+    block = editor.document().firstBlock()
+    while block.blockNumber() < editor.document().blockCount() - 1:
+        blank_line = len(block.text().strip()) == 0
+        if TextBlockHelper.get_fold_lvl(block) > 0:
+            if not blank_line:
+                assert block.isVisible() is False
+        else:
+            assert block.isVisible() is True
+        if TextBlockHelper.is_fold_trigger(block):
+            assert TextBlockHelper.is_collapsed(block) is True
+        block = block.next()
+    panel.expand_all()
+    block = editor.document().firstBlock()
+    while block.isValid():
+        assert block.isVisible()
+        if TextBlockHelper.is_fold_trigger(block):
+            assert TextBlockHelper.is_collapsed(block) is False
+        block = block.next()
+
+
+@editor_open('test/test_api/folding_cases/foo.py')
+def test_fold_decorations(editor):
+    panel = get_panel(editor)
+    editor.syntax_highlighter.rehighlight()
+    block = editor.document().firstBlock()
+    while not TextBlockHelper.is_fold_trigger(block):
+        block = block.next()
+    panel.toggle_fold_trigger(block)
+    deco = panel._get_fold_decoration(block)
+    assert deco is not None
+    assert deco in list(editor.decorations)
+    # decorations follow their trigger block when lines are inserted above
+    nbr = block.blockNumber()
+    tc = editor.textCursor()
+    tc.movePosition(tc.Start)
+    tc.insertText('\n\n')
+    assert block.blockNumber() == nbr + 2
+    assert panel._get_fold_decoration(block) is deco
+    assert list(panel._block_decos) == [nbr + 2]
+    panel.toggle_fold_trigger(block)
+    assert panel._get_fold_decoration(block) is None
+    assert deco not in list(editor.decorations)
@@ -29,6 +29,21 @@ def test_request_search(editor):
     assert panel.cpt_occurences > 1
 
 
+@editor_open(__file__)
+def test_search_invalid_regex(editor):
+    panel = get_panel(editor)
+    limit = editor.backend.local_job_size_limit
+    # run the search in process
+    editor.backend.local_job_size_limit = len(editor.toPlainText()) + 1
+    try:
+        panel._working = True
+        panel._exec_search('(', (True, False, False, False))
+    finally:
+        editor.backend.local_job_size_limit = limit
+    assert not panel._working
+    assert panel.cpt_occurences == 0
+
+
 @editor_open(__file__)
 @ensure_connected
 def test_action_search_triggered(editor):
@@ -158,3 +173,17 @@ def test_event_filter(editor):
     editor.show()
     QTest.qWait(1000)
     assert not panel.isVisible()
+
+
+@ensure_connected
+def test_replace_all(editor):
+    panel = get_panel(editor)
+    editor.setPlainText('foo bar foo\n' * 100, '', 'utf-8')
+    panel._exec_search('foo', (False, True, True, False))
+    assert panel.cpt_occurences == 200
+    panel.replace_all('spam')
+    assert panel.cpt_occurences == 0
+    assert editor.toPlainText() == 'spam bar spam\n' * 100
+    # all replacements are undone in one step
+    editor.undo()
+    assert editor.toPlainText() == 'foo bar foo\n' * 100
@@ -43,3 +43,27 @@ def test_splittable_codedit_tab_widget():
     assert tw.count() == 0
     tw.close()
     del tw
+
+
+def test_close_original_with_clones():
+    tw = SplittableCodeEditTabWidget()
+    tw.show()
+    original = tw.open_document(__file__)
+    tw.split(original, QtCore.Qt.Vertical)
+    tw.split(original, QtCore.Qt.Vertical)
+    clones = list(original.clones)
+    assert len(clones) == 2
+    document = original.document()
+    tab_widget = original.parent_tab_widget
+    tab_widget.remove_tab(tab_widget.indexOf(original))
+    QTest.qWait(100)
+    # the first clone now highlights the shared document, the other one
+    # delegates to it
+    highlighters = [c.syntax_highlighter for c in clones]
+    assert [h.document() for h in highlighters].count(document) == 1
+    assert highlighters[0].document() == document
+    assert highlighters[1].document() is None
+    assert highlighters[1]._document_owner() is highlighters[0]
+    tw.close_all()
+    tw.close()
+    del tw